@@ -0,0 +1,146 @@
+"""Throughput / memory / retrieval-agreement benchmark for the embedding backends.
+
+Every configuration runs in a fresh process, so load time and peak memory are its own. Each one
+embeds the same chunks and queries; agreement@k is the share of the baseline's top-k chunks per
+query (the current full-precision model) that the configuration also ranks in its top-k.
+
+    python -m benchmarks.embeddings                                  # torch vs onnx vs onnx-int8
+    python -m benchmarks.embeddings --backends torch onnx-int8 --threads 4 --batch-size 32
+    python -m benchmarks.embeddings --models sentence-transformers/all-MiniLM-L6-v2 --text reports.txt
+"""
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from concurrent.futures import ProcessPoolExecutor
+from utils.labParser import LAB_FIELDS
+from utils.models import EMBEDDING_MODEL, EMBEDDING_BACKENDS, EMBED_BATCH_SIZE, EMBEDDING_THREADS
+import multiprocessing
+import numpy as np
+import argparse
+import random
+import time
+
+try:
+    import resource
+except ImportError:  # resource is Unix only
+    resource = None
+
+SYMPTOMS = ["fatigue", "dizziness", "frequent urination", "chest pain", "shortness of breath", "headache", "weight gain", "pale skin"]
+
+
+def syntheticChunks(count, seed):
+    """Lab-report-like chunks: a few parameters with values, units and a remark each."""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        fields = rng.sample(LAB_FIELDS, rng.randint(3, 6))
+        lines = [f"{field.replace('_', ' ').title()}: {rng.uniform(0.5, 300):.1f} ({rng.choice(['normal', 'high', 'low', 'borderline'])})" for field in fields]
+        lines.append(f"Patient reports {rng.choice(SYMPTOMS)} and {rng.choice(SYMPTOMS)}.")
+        chunks.append("\n".join(lines))
+    return chunks
+
+
+def fileChunks(path, limit):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_text(text)[:limit]
+
+
+def syntheticQueries(count, seed):
+    rng = random.Random(seed + 1)
+    return [
+        f"{rng.choice(SYMPTOMS)} with {rng.choice(['high', 'low'])} {rng.choice(LAB_FIELDS).replace('_', ' ')}"
+        for _ in range(count)
+    ]
+
+
+def _peakMemoryMB():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else float("nan")
+
+
+def runConfiguration(model, backend, batch_size, threads, chunks, queries):
+    """Runs in a worker process. Returns timings, memory and the normalized vectors."""
+    from utils.models import buildEmbedding
+
+    memory_before = _peakMemoryMB()
+    start = time.perf_counter()
+    embedding = buildEmbedding(model, backend, batch_size, threads)
+    embedding.embed_documents(chunks[:batch_size])  # first call pays for graph setup and allocation
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    documents = np.asarray(embedding.embed_documents(chunks), dtype=np.float32)
+    embed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    query_vectors = np.asarray([embedding.embed_query(query) for query in queries], dtype=np.float32)
+    query_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+    documents /= np.linalg.norm(documents, axis=1, keepdims=True)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return {
+        "load_seconds": load_seconds,
+        "chunks_per_second": len(chunks) / embed_seconds,
+        "query_ms": query_ms,
+        "memory_mb": _peakMemoryMB() - memory_before,
+        "documents": documents,
+        "queries": query_vectors,
+    }
+
+
+def topK(documents, queries, k):
+    scores = queries @ documents.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def agreementAtK(found, expected):
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, expected)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=[EMBEDDING_MODEL])
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS, help="0 keeps the library default")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--text", default=None, help="chunk this text file instead of generating reports")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    chunks = fileChunks(args.text, args.chunks) if args.text else syntheticChunks(args.chunks, args.seed)
+    queries = syntheticQueries(args.queries, args.seed)
+    print(f"{len(chunks)} chunks, {len(queries)} queries, batch size {args.batch_size}, threads {args.threads or 'default'}")
+
+    # The baseline is what the application uses today: full precision PyTorch on the default model
+    configurations = [(EMBEDDING_MODEL, "torch")]
+    configurations += [(model, backend) for model in args.models for backend in args.backends if (model, backend) != (EMBEDDING_MODEL, "torch")]
+
+    results = {}
+    for model, backend in configurations:
+        # A fresh process per configuration keeps load time and memory separate
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                results[(model, backend)] = pool.submit(
+                    runConfiguration, model, backend, args.batch_size, args.threads, chunks, queries
+                ).result()
+            except Exception as e:
+                print(f"{model} ({backend}) failed: {e}")
+
+    baseline = results.get((EMBEDDING_MODEL, "torch"))
+    if baseline is None:
+        raise SystemExit("The baseline configuration failed; nothing to compare against")
+    expected = topK(baseline["documents"], baseline["queries"], args.k)
+
+    print()
+    print(f"{'model':<45} {'backend':<10} {'load (s)':>9} {'chunks/s':>9} {'query (ms)':>10} {'memory (MB)':>12} {'agree@' + str(args.k):>9}")
+    for (model, backend), result in results.items():
+        found = topK(result["documents"], result["queries"], args.k)
+        print(
+            f"{model:<45} {backend:<10} {result['load_seconds']:>9.1f} {result['chunks_per_second']:>9.1f} "
+            f"{result['query_ms']:>10.1f} {result['memory_mb']:>12.0f} {agreementAtK(found, expected):>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
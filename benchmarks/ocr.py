@@ -0,0 +1,133 @@
+"""OCR time / character accuracy benchmark for the image preprocessing stage.
+
+Runs easyocr on every sample image twice, once on the raw file as before and once after
+utils.ocrPreprocess, and compares both against the expected text. Real samples are image files
+with the expected text in a .txt file of the same name next to them; without a directory,
+synthetic phone-photo-like reports are generated (large, slightly rotated, noisy).
+
+    python -m benchmarks.ocr --images samples/
+    python -m benchmarks.ocr --synthetic 5 --crop
+    python -m benchmarks.ocr --synthetic 5 --max-side 1600 --no-deskew
+"""
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from pathlib import Path
+from utils.labParser import LAB_FIELDS
+from utils.ocrPreprocess import preprocessFile, OCR_MAX_SIDE
+import numpy as np
+import tempfile
+import argparse
+import random
+import time
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def loadSamples(directory):
+    """Returns [(image_path, expected_text)] for every image that has a matching .txt file."""
+    samples = []
+    for path in sorted(Path(directory).iterdir()):
+        truth = path.with_suffix(".txt")
+        if path.suffix.lower() in IMAGE_SUFFIXES and truth.exists():
+            samples.append((path, truth.read_text(encoding="utf-8")))
+    return samples
+
+
+def loadFont(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+def syntheticSamples(count, directory, seed):
+    """Writes report-like photos of 4000x3000 pixels, rotated a few degrees with some blur and noise."""
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    font = loadFont(64)
+    samples = []
+    for index in range(count):
+        lines = [f"{field.replace('_', ' ').title()}  {rng.uniform(0.5, 300):.1f}" for field in rng.sample(LAB_FIELDS, 10)]
+        image = Image.new("L", (4000, 3000), 235)
+        draw = ImageDraw.Draw(image)
+        for row, line in enumerate(lines):
+            draw.text((500, 450 + row * 110), line, fill=20, font=font)
+
+        image = image.rotate(rng.uniform(-5, 5), resample=Image.BICUBIC, fillcolor=235).filter(ImageFilter.GaussianBlur(1.2))
+        pixels = np.asarray(image, dtype=np.float64) + noise.normal(0, 12, (image.height, image.width))
+        path = Path(directory) / f"synthetic_{index}.jpg"
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGB").save(path, quality=90)
+        samples.append((path, "\n".join(lines)))
+    return samples
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+def editDistance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def characterAccuracy(found, expected):
+    """1 - edit distance / expected length, on lowercased text with collapsed whitespace (floored at 0)."""
+    found, expected = _normalize(found), _normalize(expected)
+    if not expected:
+        return float("nan")
+    return max(0.0, 1 - editDistance(found, expected) / len(expected))
+
+
+def runOcr(reader, source):
+    start = time.perf_counter()
+    text = "\n".join(reader.readtext(source, detail=0))
+    return text, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=None, help="directory of images with expected text in <name>.txt")
+    parser.add_argument("--synthetic", type=int, default=3, help="generated samples when --images is not given")
+    parser.add_argument("--max-side", type=int, default=OCR_MAX_SIDE)
+    parser.add_argument("--no-deskew", action="store_true")
+    parser.add_argument("--crop", action="store_true", help="also crop to the detected text region")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        samples = loadSamples(args.images) if args.images else syntheticSamples(args.synthetic, scratch, args.seed)
+        if not samples:
+            raise SystemExit("No samples found; images need a .txt file with the expected text next to them")
+
+        # Imported here because it pulls in torch; the sample generators are reused without it
+        from utils.models import getReader
+
+        reader = getReader()
+        # One throwaway call so model warm-up is not billed to the first sample
+        reader.readtext(np.full((64, 64), 255, dtype=np.uint8), detail=0)
+
+        print(f"{'image':<28} {'raw (s)':>8} {'raw acc':>8} {'prep (s)':>9} {'ocr (s)':>8} {'prep acc':>9}")
+        totals = []
+        for path, expected in samples:
+            raw_text, raw_seconds = runOcr(reader, str(path))
+
+            start = time.perf_counter()
+            image = preprocessFile(path, args.max_side, not args.no_deskew, args.crop)
+            prep_seconds = time.perf_counter() - start
+            text, ocr_seconds = runOcr(reader, image)
+
+            row = (raw_seconds, characterAccuracy(raw_text, expected), prep_seconds, ocr_seconds, characterAccuracy(text, expected))
+            totals.append(row)
+            print(f"{path.name[:28]:<28} {row[0]:>8.2f} {row[1]:>8.3f} {row[2]:>9.2f} {row[3]:>8.2f} {row[4]:>9.3f}")
+
+    means = np.nanmean(np.asarray(totals), axis=0)
+    print(f"{'mean':<28} {means[0]:>8.2f} {means[1]:>8.3f} {means[2]:>9.2f} {means[3]:>8.2f} {means[4]:>9.3f}")
+    print(f"End-to-end: {means[0]:.2f}s raw vs {means[2] + means[3]:.2f}s with preprocessing")
+
+
+if __name__ == "__main__":
+    main()
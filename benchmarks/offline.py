@@ -0,0 +1,379 @@
+"""Offline end-to-end benchmark of extractText, analysis and generateSuggestions.
+
+Everything runs on this machine: Gemini and OpenRouter are replaced by a local OpenAI-compatible
+server with configurable latency, Qdrant runs in memory (AsyncQdrantClient(":memory:")) and
+MongoDB by mongomock-motor, injected through utils.database.useClients. Uploads are generated:
+text PDFs, scanned (image-only) PDFs, phone-photo-like images and meter CSV exports. The
+embedding and OCR models run for real, so they have to be in the local model cache already.
+
+Reports per-stage latency (p50 / p95), upload throughput and peak memory. With --save the
+results are written as JSON; with --baseline a previous run is compared and the command exits
+with status 1 when a stage's p50 regressed by more than --tolerance.
+
+    pip install mongomock-motor
+    python -m benchmarks.offline
+    python -m benchmarks.offline --kinds pdf image --files 10 --concurrency 4 --llm-latency 0.8
+    python -m benchmarks.offline --save before.json
+    python -m benchmarks.offline --baseline before.json --tolerance 0.15
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image, ImageDraw
+from pathlib import Path
+from utils.labParser import LAB_FIELDS
+from benchmarks.ocr import syntheticSamples, loadFont
+import numpy as np
+import threading
+import tempfile
+import argparse
+import asyncio
+import random
+import json
+import time
+import os
+
+try:
+    import resource
+except ImportError:  # resource is Unix only
+    resource = None
+
+KINDS = ["pdf", "scanned", "image", "csv"]
+SYMPTOMS = "tired all the time, thirsty and waking up at night to urinate"
+
+# How each parameter is written in the generated reports, with a plausible value range
+REPORT_LINES = {
+    "blood_sugar_fasting": ("Fasting Blood Sugar", "mg/dL", 70, 160),
+    "blood_sugar_pp": ("Post Prandial Blood Sugar", "mg/dL", 100, 220),
+    "hemoglobin": ("Hemoglobin", "g/dL", 10, 17),
+    "wbc": ("WBC Count", "cells/cumm", 4000, 12000),
+    "platelets": ("Platelet Count", "cells/cumm", 150000, 450000),
+    "cholesterol_total": ("Total Cholesterol", "mg/dL", 140, 260),
+    "hdl": ("HDL Cholesterol", "mg/dL", 30, 70),
+    "ldl": ("LDL Cholesterol", "mg/dL", 60, 180),
+    "triglycerides": ("Triglycerides", "mg/dL", 80, 300),
+    "creatinine": ("Serum Creatinine", "mg/dL", 0.6, 1.6),
+}
+
+
+# --- Fake OpenAI-compatible server ------------------------------------------------------------
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    """Answers /chat/completions after `latency` seconds, streaming `tokens` tokens when asked to."""
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.server.latency)
+
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            # Extraction: every field the model was asked about gets a value
+            rng = random.Random(len(json.dumps(body)))
+            content = json.dumps({
+                **{field: round(rng.uniform(*REPORT_LINES[field][2:]), 1) if field in REPORT_LINES else None for field in LAB_FIELDS},
+                "tsh": round(rng.uniform(0.5, 6), 2),
+                "additional_notes": "Synthetic report",
+            })
+            tokens = [content]
+        else:
+            tokens = [f"word{index} " for index in range(self.server.tokens)]
+            content = "".join(tokens)
+
+        created = int(time.time())
+        if not body.get("stream"):
+            self._send("application/json", json.dumps({
+                "id": "offline", "object": "chat.completion", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            }).encode())
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for token in tokens:
+            chunk = {
+                "id": "offline", "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send(self, content_type, payload):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startFakeServer(latency, token_delay, tokens):
+    """Starts the fake server on a free local port and returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCompletionHandler)
+    server.daemon_threads = True
+    server.latency, server.token_delay, server.tokens = latency, token_delay, tokens
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# --- Synthetic uploads -------------------------------------------------------------------------
+
+def reportLines(rng):
+    lines = ["City Diagnostics Laboratory", f"Patient ID: {rng.randint(10000, 99999)}", ""]
+    for field in rng.sample(list(REPORT_LINES), 7):
+        label, unit, low, high = REPORT_LINES[field]
+        value = rng.uniform(low, high)
+        lines.append(f"{label}: {value:.1f} {unit}" if high < 1000 else f"{label}: {int(value)} {unit}")
+    # Mentioned but not machine-readable, so the extraction has to ask the LLM
+    lines.append("Thyroid Stimulating Hormone (TSH): see attached sheet")
+    lines.append("Remarks: clinical correlation advised.")
+    return lines
+
+
+def _pdfString(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def writeTextPdf(path, pages):
+    """Writes a minimal PDF with one Helvetica text block per page; pypdf reads the text back."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * index} 0 R' for index in range(len(pages)))}] /Count {len(pages)} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for index, lines in enumerate(pages):
+        stream = "BT /F1 11 Tf 14 TL 72 760 Td " + " ".join(f"({_pdfString(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(bytes(output))
+
+
+def writeScannedPdf(path, lines):
+    """Writes an image-only PDF page (150 dpi letter), as a scanner would."""
+    image = Image.new("L", (1275, 1650), 250)
+    draw = ImageDraw.Draw(image)
+    font = loadFont(28)
+    for row, line in enumerate(lines):
+        draw.text((120, 150 + row * 48), line, fill=15, font=font)
+    image.convert("RGB").save(path, "PDF", resolution=150)
+
+
+def writeMeterCsv(path, rows, rng):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Date,Time,Glucose (mg/dL),Meal Tag\n")
+        start = time.time() - rows * 6 * 3600
+        for row in range(rows):
+            stamp = time.strftime("%Y-%m-%d,%H:%M", time.gmtime(start + row * 6 * 3600))
+            tag = rng.choice(["Before meal", "After meal"])
+            f.write(f"{stamp},{rng.uniform(70, 220):.0f},{tag}\n")
+
+
+def buildUploads(kinds, count, directory, csv_rows, seed):
+    """Returns [(kind, path, extension)] for `count` generated files of every kind."""
+    rng = random.Random(seed)
+    uploads = []
+    for kind in kinds:
+        if kind == "image":
+            uploads += [("image", path, "jpg") for path, _ in syntheticSamples(count, directory, seed)]
+            continue
+        for index in range(count):
+            path = Path(directory) / f"{kind}_{index}"
+            if kind == "pdf":
+                path = path.with_suffix(".pdf")
+                writeTextPdf(path, [reportLines(rng) for _ in range(rng.randint(1, 3))])
+                uploads.append((kind, path, "pdf"))
+            elif kind == "scanned":
+                path = path.with_suffix(".pdf")
+                writeScannedPdf(path, reportLines(rng))
+                uploads.append((kind, path, "pdf"))
+            elif kind == "csv":
+                path = path.with_suffix(".csv")
+                writeMeterCsv(path, csv_rows, rng)
+                uploads.append((kind, path, "csv"))
+    return uploads
+
+
+# --- Measurement -------------------------------------------------------------------------------
+
+def peakMemoryMB():
+    """Peak resident memory of this process and of its finished child processes (OCR workers), in MB."""
+    if resource is None:
+        return float("nan"), float("nan")
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    )
+
+
+def summarize(samples):
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        "count": int(len(values)),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "mean": float(values.mean()),
+    }
+
+
+def compareBaseline(stages, baseline_path, tolerance, min_seconds):
+    """Prints the p50 change of every stage against a saved run. Returns the regressed stages.
+
+    A stage only counts as regressed when it is slower by more than `tolerance` and by more than
+    `min_seconds`, so sub-millisecond stages do not trip on noise.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["stages"]
+    regressed = []
+    print()
+    print(f"{'stage':<24} {'baseline p50':>13} {'p50':>9} {'change':>8}")
+    for name, stats in stages.items():
+        if name not in baseline or not baseline[name]["p50"]:
+            continue
+        change = stats["p50"] / baseline[name]["p50"] - 1
+        slower = change > tolerance and stats["p50"] - baseline[name]["p50"] > min_seconds
+        print(f"{name:<24} {baseline[name]['p50']:>13.3f} {stats['p50']:>9.3f} {change:>+8.1%}{'  REGRESSION' if slower else ''}")
+        if slower:
+            regressed.append(name.strip())
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", nargs="+", default=KINDS, choices=KINDS)
+    parser.add_argument("--files", type=int, default=3, help="generated uploads per kind")
+    parser.add_argument("--csv-rows", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=1, help="uploads processed at the same time")
+    parser.add_argument("--queries", type=int, default=5, help="analysis and suggestion calls per user")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds before the fake LLM answers")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens in every fake answer")
+    parser.add_argument("--embedding-cache", action="store_true", help="keep the embedding cache on (off measures the model)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="compare against a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown before flagging")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    scratch = tempfile.TemporaryDirectory()
+    server, base_url = startFakeServer(args.llm_latency, args.token_delay, args.tokens)
+
+    # The application modules read their settings at import time, so they are imported only now
+    os.environ.update({
+        "DATA_DIR": scratch.name,
+        "GEMINI_BASE_URL": base_url,
+        "OPENROUTER_BASE_URL": base_url,
+        "GOOGLE_API_KEY": "offline",
+        "OPENAI_API_KEY": "offline",
+        "EMBEDDING_CACHE": "1" if args.embedding_cache else "0",
+    })
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("The MongoDB stand-in needs mongomock-motor: pip install mongomock-motor")
+    from qdrant_client import AsyncQdrantClient
+    from utils.database import useClients, runAsync
+    useClients(mongo=AsyncMongoMockClient(), qdrant=AsyncQdrantClient(location=":memory:"))
+
+    from utils.models import warmUp
+    from utils.vectorStore import ensureCollection
+    from utils.extractTextFunction import extractText
+    from utils.analysis import analysis, analysisMessages, generateSuggestions
+
+    stages = {}
+    memory = {}
+
+    def record(name, seconds):
+        stages.setdefault(name, []).append(seconds)
+
+    start = time.perf_counter()
+    models = warmUp()
+    runAsync(ensureCollection())
+    record("model load", time.perf_counter() - start)
+    memory["after model load"] = peakMemoryMB()
+    print(f"Models loaded: {json.dumps(models)}")
+
+    uploads = buildUploads(args.kinds, args.files, scratch.name, args.csv_rows, args.seed)
+    users = [f"bench-user-{index}" for index in range(args.users)]
+    total_bytes = sum(os.path.getsize(path) for _, path, _ in uploads)
+    print(f"{len(uploads)} uploads ({total_bytes / 1024 / 1024:.1f} MB) for {len(users)} users, concurrency {args.concurrency}")
+
+    async def ingestAll():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def ingest(index, kind, path, extension):
+            async with semaphore:
+                started = time.perf_counter()
+                report = await extractText(str(path), extension, path.name, users[index % len(users)], force=True)
+                record(f"upload/{kind}", time.perf_counter() - started)
+                for stage, seconds in (report.get("timings") or {}).items():
+                    if stage != "total":
+                        record(f"  {kind}/{stage}", seconds)
+
+        await asyncio.gather(*[ingest(index, *upload) for index, upload in enumerate(uploads)])
+
+    start = time.perf_counter()
+    runAsync(ingestAll())
+    ingest_seconds = time.perf_counter() - start
+    memory["after uploads"] = peakMemoryMB()
+
+    for user in users:
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            runAsync(analysisMessages(SYMPTOMS, user))
+            record("analysis/retrieval", time.perf_counter() - started)
+
+            started = time.perf_counter()
+            runAsync(analysis(SYMPTOMS, user))
+            record("analysis", time.perf_counter() - started)
+
+            started = time.perf_counter()
+            runAsync(generateSuggestions(user, force=True))
+            record("suggestions", time.perf_counter() - started)
+    memory["after analysis"] = peakMemoryMB()
+    server.shutdown()
+
+    summary = {name: summarize(samples) for name, samples in stages.items()}
+    print()
+    print(f"{'stage':<24} {'n':>4} {'p50 (s)':>9} {'p95 (s)':>9} {'mean (s)':>9}")
+    for name, stats in summary.items():
+        print(f"{name:<24} {stats['count']:>4} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['mean']:>9.3f}")
+
+    throughput = {
+        "uploads_per_second": len(uploads) / ingest_seconds,
+        "mb_per_second": total_bytes / 1024 / 1024 / ingest_seconds,
+    }
+    print()
+    print(f"Throughput: {throughput['uploads_per_second']:.2f} uploads/s, {throughput['mb_per_second']:.2f} MB/s over {ingest_seconds:.1f}s")
+    for phase, (own, children) in memory.items():
+        print(f"Peak memory {phase}: {own:.0f} MB (child processes {children:.0f} MB)")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "stages": summary, "throughput": throughput, "memory_mb": memory}, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    regressed = compareBaseline(summary, args.baseline, args.tolerance, args.min_seconds) if args.baseline else []
+    scratch.cleanup()
+    if regressed:
+        raise SystemExit(f"p50 regressed by more than {args.tolerance:.0%} in: {', '.join(regressed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Recall / latency / memory benchmark for the quantized storage modes of ai_health_analysis.
+
+Copies points from the live collection (or generates synthetic ones) into scratch collections on a
+local Qdrant, one per storage mode, and runs the same per-user filtered search that analysis uses
+against each of them. Recall@k is measured against an exact search on the unquantized baseline.
+
+Memory is read from Qdrant itself before and after each collection is built and indexed, so it
+includes the HNSW graph, the payload index and the copies kept for rescoring. By default that is
+the resident / allocated bytes on Qdrant's /metrics endpoint; with --qdrant-pid it is the RSS of a
+dedicated local Qdrant process. Use an otherwise idle instance, other traffic shows up as memory.
+
+    python -m benchmarks.quantization --modes none scalar binary --limit 20000 --queries 200
+    python -m benchmarks.quantization --synthetic 50000 --users 500
+    python -m benchmarks.quantization --synthetic 50000 --multitenancy   # per-user HNSW graphs
+    python -m benchmarks.quantization --synthetic 50000 --qdrant-pid $(pgrep -f qdrant)
+"""
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, SearchParams
+from utils.vectorStore import collectionConfig, searchParams, userFilter, userIndexSchema, COLLECTION_NAME
+import numpy as np
+import argparse
+import httpx
+import re
+import random
+import time
+import os
+
+MEMORY_METRICS = ("memory_resident_bytes", "memory_allocated_bytes")
+
+
+def qdrantMemory(url, pid=None):
+    """Returns {"resident": bytes, "allocated": bytes} as Qdrant reports it (allocated is None for a pid)."""
+    if pid is not None:
+        # VmRSS of the Qdrant process, in kB
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        return {"resident": rss * 1024, "allocated": None}
+
+    api_key = os.getenv("QDRANT_API_KEY")
+    response = httpx.get(f"{url.rstrip('/')}/metrics", headers={"api-key": api_key} if api_key else {}, timeout=30)
+    response.raise_for_status()
+    values = {}
+    for name in MEMORY_METRICS:
+        match = re.search(rf"^{name}(?:{{[^}}]*}})?\s+([0-9.eE+-]+)$", response.text, re.MULTILINE)
+        values[name] = float(match.group(1)) if match else None
+    if values["memory_resident_bytes"] is None:
+        raise SystemExit(f"{url}/metrics reports no memory gauges; pass --qdrant-pid of a local Qdrant instead")
+    return {"resident": values["memory_resident_bytes"], "allocated": values["memory_allocated_bytes"]}
+
+
+def memoryDelta(before, after):
+    """Megabytes gained per gauge between two qdrantMemory readings."""
+    return {
+        key: (after[key] - before[key]) / 1024 / 1024 if before[key] is not None and after[key] is not None else float("nan")
+        for key in before
+    }
+
+
+def loadPoints(client, limit):
+    """Returns (vectors, users) for up to `limit` points of the live collection."""
+    vectors, users = [], []
+    offset = None
+    while len(vectors) < limit:
+        points, offset = client.scroll(
+            COLLECTION_NAME,
+            limit=min(1000, limit - len(vectors)),
+            offset=offset,
+            with_vectors=True,
+            with_payload=["user"],
+        )
+        for point in points:
+            if point.payload.get("user"):
+                vectors.append(point.vector)
+                users.append(point.payload["user"])
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32), users
+
+
+def syntheticPoints(count, dimension, user_count, seed):
+    """Random unit vectors spread over users with a long-tailed (Zipf-like) tenant size."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    weights = 1 / np.arange(1, user_count + 1)
+    owners = rng.choice(user_count, size=count, p=weights / weights.sum())
+    return vectors, [f"user-{owner}" for owner in owners]
+
+
+def buildCollection(client, name, mode, vectors, users, multitenancy):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(collection_name=name, **collectionConfig(vectors.shape[1], mode, multitenancy))
+    client.create_payload_index(name, field_name="user", field_schema=userIndexSchema(multitenancy), wait=True)
+
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), 512):
+        client.upsert(
+            name,
+            points=[
+                PointStruct(id=index, vector=vectors[index].tolist(), payload={"user": users[index]})
+                for index in range(offset, min(offset + 512, len(vectors)))
+            ],
+            wait=True,
+        )
+    # Indexing and quantization continue in the background after the upsert returns
+    while client.get_collection(name).status != "green":
+        time.sleep(0.5)
+    return time.perf_counter() - start
+
+
+def runQueries(client, name, queries, k, params):
+    latencies, results = [], []
+    for vector, user in queries:
+        start = time.perf_counter()
+        response = client.query_points(
+            name,
+            query=vector,
+            query_filter=userFilter(user),
+            search_params=params,
+            limit=k,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([point.id for point in response.points])
+    return np.asarray(latencies), results
+
+
+def recallAtK(results, truth):
+    scores = [len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth) if expected]
+    return float(np.mean(scores)) if scores else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("VECTORDB_URL", "http://localhost:6333"))
+    parser.add_argument("--modes", nargs="+", default=["none", "scalar", "binary"], choices=["none", "scalar", "binary"])
+    parser.add_argument("--limit", type=int, default=20000, help="points copied from the live collection")
+    parser.add_argument("--synthetic", type=int, default=0, help="use this many random points instead of live data")
+    parser.add_argument("--dimension", type=int, default=768, help="vector size for synthetic points")
+    parser.add_argument("--users", type=int, default=200, help="tenants for synthetic points")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--multitenancy", action="store_true", help="build the collections with per-user HNSW graphs")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch collections afterwards")
+    parser.add_argument("--qdrant-pid", type=int, default=None, help="read memory as the RSS of this local Qdrant process")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url, api_key=os.getenv("QDRANT_API_KEY") or None, timeout=60)
+
+    if args.synthetic:
+        vectors, users = syntheticPoints(args.synthetic, args.dimension, args.users, args.seed)
+    else:
+        vectors, users = loadPoints(client, args.limit)
+    if not len(vectors):
+        raise SystemExit("No points to benchmark; use --synthetic N to generate some")
+
+    # Queries are perturbed copies of stored chunks, searched within their owner's reports
+    rng = np.random.default_rng(args.seed)
+    queries = []
+    for index in random.Random(args.seed).sample(range(len(vectors)), min(args.queries, len(vectors))):
+        query = vectors[index] + rng.normal(0, 0.05, vectors.shape[1]).astype(np.float32)
+        queries.append(((query / np.linalg.norm(query)).tolist(), users[index]))
+
+    print(f"{len(vectors)} points, {vectors.shape[1]} dimensions, {len(set(users))} users, {len(queries)} queries")
+
+    baseline = "bench_quantization_none"
+    for mode in dict.fromkeys(["none", *args.modes]):
+        if client.collection_exists(f"bench_quantization_{mode}"):
+            client.delete_collection(f"bench_quantization_{mode}")
+
+    collections = {}
+    memory = {}
+    for mode in dict.fromkeys(["none", *args.modes]):
+        name = f"bench_quantization_{mode}"
+        before = qdrantMemory(args.url, args.qdrant_pid)
+        seconds = buildCollection(client, name, mode, vectors, users, args.multitenancy)
+        memory[mode] = memoryDelta(before, qdrantMemory(args.url, args.qdrant_pid))
+        collections[mode] = name
+        print(f"Built {name} in {seconds:.1f}s")
+
+    _, truth = runQueries(client, baseline, queries, args.k, SearchParams(exact=True))
+
+    print()
+    print(f"{'mode':<8} {'resident (MB)':>14} {'allocated (MB)':>15} {'p50 (ms)':>9} {'p99 (ms)':>9} {'recall@' + str(args.k):>9}")
+    for mode in args.modes:
+        # Warm the caches once so the first query's page faults don't land in the percentiles
+        runQueries(client, collections[mode], queries[:10], args.k, searchParams(mode))
+        latencies, results = runQueries(client, collections[mode], queries, args.k, searchParams(mode))
+        print(
+            f"{mode:<8} {memory[mode]['resident']:>14.1f} {memory[mode]['allocated']:>15.1f} {np.percentile(latencies, 50):>9.2f} "
+            f"{np.percentile(latencies, 99):>9.2f} {recallAtK(results, truth):>9.3f}"
+        )
+
+    if not args.keep:
+        for name in collections.values():
+            client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import requests
 from urllib.parse import urlencode
 import os
 from dotenv import load_dotenv
+from utils.models import warmUpInBackground
+from utils.bootstrap import bootstrap
 
 # --- 0. Environment Setup ---
 
@@ -16,6 +18,13 @@ CLIENT_SECRET = os.getenv("AUTH0_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("AUTH0_CALLBACK_URL")
 AUDIENCE = os.getenv("AUTH0_AUDIENCE")
 
+# One-time MongoDB index and Qdrant collection setup for this process
+bootstrap()
+
+# Optionally load the OCR and embedding models before the first upload or query
+if os.getenv("WARM_MODELS", "").lower() in ("1", "true", "yes"):
+    warmUpInBackground()
+
 # Set Streamlit Page Configuration
 st.set_page_config(page_title="Auth0 Login & Logout", layout="centered")
 
@@ -1,58 +1,52 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 import os
+from utils.database import runAsync
+from utils.metricsStore import loadMetricsFrame
+from utils.healthIndicators import REFERENCE_RANGES, userIndicators
+from utils.downsample import downsampleSeries, boxStatistics, TREND_POINT_BUDGET
+from utils.userData import getDataVersion, DATA_VERSION_TTL
+from utils.bootstrap import bootstrap
+
+# One-time MongoDB index and Qdrant collection setup for this process
+bootstrap()
+
+DASHBOARD_CACHE_ENTRIES = int(os.getenv("DASHBOARD_CACHE_ENTRIES", "256"))
+
+# Load the user's lab values from the compact Metrics collection, one row per report.
+# Cached per (user, data_version): widget reruns reuse the frame, and any upload or symptom
+# update bumps the version so the next run loads fresh data. Least recently used entries are
+# evicted beyond DASHBOARD_CACHE_ENTRIES.
+@st.cache_data(max_entries=DASHBOARD_CACHE_ENTRIES, show_spinner=False)
+def loadDashboardData(current_user, data_version):
+    df = runAsync(loadMetricsFrame(current_user))
+    # Indicators need every LAB_FIELDS column, including the ones none of the reports contained
+    indicators = userIndicators(df)
+    # Parameters that none of the reports contained are left out of the tables and charts
+    df = df.dropna(axis="columns", how="all")
+    return df, df.describe(), indicators, boxStatistics(df)
 
-# Connect to MongoDB
 def getData():
-    client = MongoClient(os.getenv("DATABASE_URL"))
-    db = client["health"]
-    reports = db["Sources"]
-
     current_user = st.session_state["username"]
-    # <CHANGE> Fetch real data from MongoDB instead of using random seed data
-    cursor = reports.find({"user":current_user})
-    data = [item.get("parsed_data", item) for item in cursor]
-    client.close()
-    return data
-
-data_list = getData()
-
-if not data_list:
-    st.warning("No medical data found in database. Please upload reports first.")
-    st.stop()
+    data_version = runAsync(getDataVersion(current_user, max_age=DATA_VERSION_TTL))
+    return loadDashboardData(current_user, data_version)
 
 if "username" not in st.session_state or not st.session_state["username"]:
     st.error("Kindly Login to find the Detailed Analysis")
     st.stop()  # Better than raising Exception in Streamlit
 
+df, summary, indicators, box_stats = getData()
+
+if df.empty:
+    st.warning("No medical data found in database. Please upload reports first.")
+    st.stop()
+
 st.set_page_config(page_title="Medical Report Dashboard", layout="wide")
 st.title("Medical Report Dashboard")
 
-# Reference normal ranges for parameters
-normal_ranges = {
-    "blood_sugar_fasting": {"range": (70, 100), "unit": "mg/dL"},
-    "blood_sugar_pp": {"range": (100, 140), "unit": "mg/dL"},
-    "blood_pressure_systolic": {"range": (90, 120), "unit": "mmHg"},
-    "blood_pressure_diastolic": {"range": (60, 80), "unit": "mmHg"},
-    "hemoglobin": {"range": (13.5, 17.5), "unit": "g/dL"},
-    "rbc": {"range": (4.5, 5.9), "unit": "M/µL"},
-    "wbc": {"range": (4000, 11000), "unit": "cells/µL"},
-    "platelets": {"range": (150000, 450000), "unit": "cells/µL"},
-    "cholesterol_total": {"range": (125, 200), "unit": "mg/dL"},
-    "hdl": {"range": (40, 60), "unit": "mg/dL"},
-    "ldl": {"range": (0, 100), "unit": "mg/dL"},
-    "triglycerides": {"range": (0, 150), "unit": "mg/dL"},
-    "creatinine": {"range": (0.6, 1.3), "unit": "mg/dL"},
-    "sgot": {"range": (0, 40), "unit": "U/L"},
-    "sgpt": {"range": (0, 40), "unit": "U/L"},
-    "tsh": {"range": (0.4, 4.0), "unit": "mIU/L"}
-}
-
-df = pd.DataFrame(data_list)
-
 # Display raw data
 st.subheader("Extracted Medical Data")
 st.dataframe(df, use_container_width=True)
@@ -68,42 +62,21 @@ if not numeric_columns:
 st.subheader("Health Indicators vs Normal Ranges")
 
 # Create columns for metric cards
-cols = st.columns(min(3, len(numeric_columns)))
+cols = st.columns(min(3, len(indicators))) if len(indicators) else []
 
-for idx, column in enumerate(numeric_columns):
-    latest_value = df[column].iloc[-1] if len(df) > 0 else None
-    
-    if latest_value is None or pd.isna(latest_value):
-        continue
-    
+# Status, distance and trend of every parameter were computed in one vectorized pass
+for idx, (column, row) in enumerate(indicators.iterrows()):
     col = cols[idx % len(cols)]
-    
-    if column in normal_ranges:
-        normal_low, normal_high = normal_ranges[column]["range"]
-        unit = normal_ranges[column]["unit"]
-        
-        # Determine status
-        if normal_low <= latest_value <= normal_high:
-            status = "Normal"
-            status_color = "green"
-        elif latest_value < normal_low:
-            status = "Low"
-            status_color = "orange"
-        else:
-            status = "High"
-            status_color = "red"
-        
-        with col:
-            st.metric(
-                label=f"{column}",
-                value=f"{latest_value:.2f} {unit}",
-                delta=f"Status: {status}",
-                delta_color="inverse"
-            )
-            st.caption(f"Normal Range: {normal_low} - {normal_high} {unit}")
-    else:
-        with col:
-            st.metric(label=column, value=f"{latest_value:.2f}")
+    with col:
+        st.metric(
+            label=f"{column}",
+            value=f"{row['latest']:.2f} {row['unit']}",
+            delta=f"Status: {row['status']}",
+            delta_color="inverse"
+        )
+        st.caption(f"Normal Range: {row['low']:g} - {row['high']:g} {row['unit']}")
+        if pd.notna(row["trend_per_30d"]):
+            st.caption(f"Trend: {row['trend_per_30d']:+.2f} {row['unit']} per 30 days")
 
 # <CHANGE> Interactive trend charts with normal range visualization
 st.subheader("Trend Analysis")
@@ -112,55 +85,37 @@ selected_parameter = st.selectbox("Select parameter to analyze:", numeric_column
 
 if selected_parameter:
     # Get the data for the selected parameter
-    values = df[selected_parameter].dropna().tolist()
-    indices = list(range(len(values)))
+    series = df[selected_parameter].dropna().to_numpy()
+    normal_low, normal_high = REFERENCE_RANGES.get(selected_parameter, {}).get("range", (None, None))
+
+    # Long histories are thinned to TREND_POINT_BUDGET points, keeping extremes and out-of-range values
+    kept = downsampleSeries(np.arange(len(series)), series, TREND_POINT_BUDGET, normal_low, normal_high)
+    if len(kept) < len(series):
+        st.caption(f"Showing {len(kept)} of {len(series)} reports")
     
     # Create interactive Plotly figure
     fig = go.Figure()
     
     # Add patient data line
     fig.add_trace(go.Scatter(
-        x=indices,
-        y=values,
+        x=kept,
+        y=series[kept],
         mode='lines+markers',
         name='Patient Data',
         line=dict(color='#1f77b4', width=2),
         marker=dict(size=8)
     ))
     
-    # Add normal range as shaded area if available
-    if selected_parameter in normal_ranges:
-        normal_low, normal_high = normal_ranges[selected_parameter]["range"]
-        unit = normal_ranges[selected_parameter]["unit"]
-        
-        # Upper bound of normal range
-        fig.add_trace(go.Scatter(
-            x=indices,
-            y=[normal_high] * len(indices),
-            fill=None,
-            mode='lines',
-            line_color='rgba(0,0,0,0)',
-            showlegend=False
-        ))
-        
-        # Lower bound of normal range
-        fig.add_trace(go.Scatter(
-            x=indices,
-            y=[normal_low] * len(indices),
-            fill='tonexty',
-            mode='lines',
-            line_color='rgba(0,0,0,0)',
-            name='Normal Range',
-            fillcolor='rgba(0,255,0,0.2)'
-        ))
-        
+    # Add normal range as a shaded band; shapes stay the same size however long the series is
+    if selected_parameter in REFERENCE_RANGES:
+        fig.add_hrect(y0=normal_low, y1=normal_high, fillcolor='rgba(0,255,0,0.2)', line_width=0, layer="below")
         fig.add_hline(y=normal_high, line_dash="dash", line_color="green", annotation_text="Upper Limit")
         fig.add_hline(y=normal_low, line_dash="dash", line_color="green", annotation_text="Lower Limit")
     
     fig.update_layout(
         title=f"{selected_parameter} Trend Analysis",
         xaxis_title="Report Number",
-        yaxis_title=f"{selected_parameter} ({normal_ranges.get(selected_parameter, {}).get('unit', '')})",
+        yaxis_title=f"{selected_parameter} ({REFERENCE_RANGES.get(selected_parameter, {}).get('unit', '')})",
         hovermode='x unified',
         height=500,
         template='plotly_white'
@@ -177,9 +132,32 @@ cols_dist = st.columns(2)
 with cols_dist[0]:
     fig_box = go.Figure()
     
-    for column in numeric_columns[:5]:  # Show first 5 for clarity
-        values = df[column].dropna()
-        fig_box.add_trace(go.Box(y=values, name=column))
+    # Quartiles and fences are precomputed, so the payload no longer grows with the history;
+    # the values beyond the whiskers (capped at BOX_OUTLIER_BUDGET) are overlaid as markers
+    for index, (column, stats) in enumerate(box_stats.head(5).iterrows()):  # Show first 5 for clarity
+        color = px.colors.qualitative.Plotly[index % len(px.colors.qualitative.Plotly)]
+        fig_box.add_trace(go.Box(
+            name=column,
+            x=[column],
+            q1=[stats["q1"]],
+            median=[stats["median"]],
+            q3=[stats["q3"]],
+            lowerfence=[stats["lowerfence"]],
+            upperfence=[stats["upperfence"]],
+            mean=[stats["mean"]],
+            marker_color=color,
+            legendgroup=column,
+        ))
+        if stats["outliers"]:
+            fig_box.add_trace(go.Scatter(
+                x=[column] * len(stats["outliers"]),
+                y=stats["outliers"],
+                mode="markers",
+                name=f"{column} outliers",
+                marker=dict(color=color, size=6, symbol="circle-open"),
+                legendgroup=column,
+                showlegend=False,
+            ))
     
     fig_box.update_layout(title="Value Distribution", height=400, template='plotly_white')
     st.plotly_chart(fig_box, use_container_width=True)
@@ -189,9 +167,9 @@ with cols_dist[1]:
     comparison_data = []
     
     for col in numeric_columns[:5]:
-        if col in normal_ranges and len(df) > 0:
-            latest = df[col].iloc[-1]
-            normal_low, normal_high = normal_ranges[col]["range"]
+        if col in indicators.index:
+            latest = indicators.at[col, "latest"]
+            normal_low, normal_high = REFERENCE_RANGES[col]["range"]
             comparison_data.append({
                 "Parameter": col,
                 "Value": latest,
@@ -229,4 +207,7 @@ with cols_dist[1]:
 
 # Summary statistics
 st.subheader("Summary Statistics")
-st.dataframe(df[numeric_columns].describe(), use_container_width=True)
\ No newline at end of file
+st.dataframe(summary[numeric_columns], use_container_width=True)
+
+st.subheader("Indicator Details")
+st.dataframe(indicators, use_container_width=True)
\ No newline at end of file
@@ -1,6 +1,10 @@
 import streamlit as st
-from utils.analysis import generateSuggestions
-import asyncio
+from utils.analysis import generateSuggestionsStream
+from utils.database import iterateAsync
+from utils.bootstrap import bootstrap
+
+# One-time MongoDB index and Qdrant collection setup for this process
+bootstrap()
 
 st.title("Suggestions 👨‍⚕️")
 
@@ -9,8 +13,11 @@ if "username" not in st.session_state or not st.session_state["username"]:
     st.stop()  # Better than raising Exception in Streamlit
 
 current_user = st.session_state["username"]
+
+# Suggestions are reused until new reports or symptoms arrive; this forces a fresh generation
+regenerate = st.button("Regenerate suggestions")
+
 try:
-    result = asyncio.run(generateSuggestions(current_user))
-    st.write(result)
+    result = st.write_stream(iterateAsync(generateSuggestionsStream(current_user, force=regenerate)))
 except Exception as e:
     st.error(f"An error occurred: {e}")
\ No newline at end of file
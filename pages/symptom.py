@@ -1,6 +1,10 @@
 import streamlit as st
-from utils.analysis import analysis
-import asyncio
+from utils.analysis import analysisStream
+from utils.database import iterateAsync
+from utils.bootstrap import bootstrap
+
+# One-time MongoDB index and Qdrant collection setup for this process
+bootstrap()
 
 st.title("Enter your Symptoms")
 
@@ -16,9 +20,9 @@ with st.form("symptom_find_disease"):
         try:
             current_user = st.session_state["username"]
             print(current_user)
-            message = asyncio.run(analysis(info, current_user))
+            # Render the answer as it is generated instead of waiting for the whole completion
+            message = st.write_stream(iterateAsync(analysisStream(info, current_user)))
             print(message)
-            st.write(message)
         except Exception as e:
                 st.error(f"An error occurred: {e}")
 
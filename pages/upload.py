@@ -1,44 +1,107 @@
 import streamlit as st
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from utils.extractTextFunction import extractText
-import os
-import asyncio
+from utils.jobQueue import saveUpload, enqueueJob, listJobs, retryJob, DONE, FAILED
+from utils.bootstrap import bootstrap
+
+# One-time MongoDB index and Qdrant collection setup for this process
+bootstrap()
 
 # App title
 st.title("AI Health Analysis")
 
 # Supported file types
-FILE_EXTENSIONS = ["jpg", "jpeg", "png", "pdf", "txt"]
+FILE_EXTENSIONS = ["jpg", "jpeg", "png", "pdf", "txt", "csv"]
 
 if "username" not in st.session_state or not st.session_state["username"]:
     st.error("Kindly Login to find the Detailed Analysis")
     st.stop()  # Better than raising Exception in Streamlit
+
+# Uploads are processed by background workers (started by bootstrap) so the page never waits
+# on OCR or the LLM. Jobs live in the job database, so they show up again after a restart, in a
+# new tab or after logging in again.
+current_user = st.session_state["username"]
+
 # Form for file upload
 with st.form("ai_health_analysis_form"):
-    uploaded_file = st.file_uploader("Upload your medical reports", type=FILE_EXTENSIONS)
+    uploaded_files = st.file_uploader("Upload your medical reports", type=FILE_EXTENSIONS, accept_multiple_files=True)
+    force_reprocess = st.checkbox("Force reprocess", help="Process the file again even if you uploaded it before")
     submit_button = st.form_submit_button("Submit Reports")
 
     if submit_button:
-        if uploaded_file is not None:
-            suffix = Path(uploaded_file.name).suffix
-
+        if uploaded_files:
             try:
-                with NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
-                    temp_file.write(uploaded_file.read())
-                    temp_file_path = temp_file.name
+                files = []
+                for uploaded_file in uploaded_files:
+                    suffix = Path(uploaded_file.name).suffix
+                    files.append({
+                        "file_path": saveUpload(uploaded_file.read(), suffix),
+                        "file_extension": suffix.lstrip(".").lower(),
+                        "file_name": uploaded_file.name,
+                    })
+
+                # Several files go through the batch pipeline as a single job
+                payload = files[0] if len(files) == 1 else {"files": files}
+                payload["force"] = force_reprocess
 
-                current_user = st.session_state["username"]
-                asyncio.run(extractText(temp_file_path, suffix.lstrip("."), Path(temp_file_path).name, current_user))
+                job_id = enqueueJob(current_user, payload)
 
-                st.success("File uploaded and processed successfully.")
+                st.success(f"{len(files)} file(s) queued for processing (job {job_id[:8]}).")
 
             except Exception as e:
                 st.error(f"An error occurred: {e}")
 
-            finally:
-                if os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-
         else:
             st.warning("Please upload a file to analyze.")
+
+
+def showResult(result):
+    name = result.get("file_name") or "Report"
+    if result.get("duplicate"):
+        st.info(f"{name}: already uploaded before, using the saved results. Tick \"Force reprocess\" to process it again.")
+    else:
+        st.success(f"{name}: processed successfully.")
+        if result.get("timings"):
+            st.caption(" · ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result["timings"].items()))
+    st.json(result.get("parsed_data") or {}, expanded=False)
+
+
+def showJob(job):
+    payload = job["payload"]
+    files = payload.get("files", [payload])
+    name = files[0]["file_name"] if len(files) == 1 else f"{len(files)} files"
+
+    if job["status"] == DONE:
+        result = job["result"] or {}
+        for report in result.get("reports", [result]):
+            showResult(report)
+
+    elif job["status"] == FAILED:
+        st.error(f"{name}: failed after {job['attempts']} attempt(s): {job['error']}")
+        if st.button("Retry", key=f"retry_{job['id']}"):
+            retryJob(job["id"])
+            st.rerun()
+
+    else:
+        st.progress(job["progress"], text=f"{name}: {job['stage']}")
+
+
+jobs = listJobs(current_user)
+pending = any(job["status"] not in (DONE, FAILED) for job in jobs)
+
+
+# Poll the queue while any of the user's jobs are still queued or running
+@st.fragment(run_every=2 if pending else None)
+def showJobs():
+    still_running = False
+    for job in listJobs(current_user):
+        showJob(job)
+        still_running = still_running or job["status"] not in (DONE, FAILED)
+
+    # Rerun the whole page once everything settles so polling stops
+    if pending and not still_running:
+        st.rerun()
+
+
+if jobs:
+    st.subheader("Your uploads")
+    showJobs()
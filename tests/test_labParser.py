@@ -0,0 +1,75 @@
+from utils.labParser import parseLabValues, unresolvedFields, LAB_FIELDS, RULE_CONFIDENCE_THRESHOLD
+
+
+def parsed(text, field):
+    values, confidence, _ = parseLabValues(text)
+    return values[field], confidence[field]
+
+
+def test_reference_range_in_brackets_is_not_the_value():
+    value, confidence = parsed("HDL Cholesterol (Ref: 40-60) 35 mg/dL", "hdl")
+    assert value == 35
+    assert confidence < RULE_CONFIDENCE_THRESHOLD
+
+
+def test_reference_range_in_square_brackets_is_not_the_value():
+    value, confidence = parsed("Hemoglobin [13.5 - 17.5] 11.2 g/dL", "hemoglobin")
+    assert value == 11.2
+    assert confidence < RULE_CONFIDENCE_THRESHOLD
+
+
+def test_ordinal_after_label_is_not_the_value():
+    value, confidence = parsed("TSH 3rd Generation 2.5", "tsh")
+    assert value == 2.5
+    assert confidence >= RULE_CONFIDENCE_THRESHOLD
+
+
+def test_bare_range_and_multiplier_before_the_value():
+    value, confidence = parsed("Platelet count 150-450 x10^3/uL 98", "platelets")
+    assert value == 98000
+    assert confidence < RULE_CONFIDENCE_THRESHOLD
+
+
+def test_range_after_the_value_lowers_confidence():
+    value, confidence = parsed("Creatinine 1.1 mg/dL 0.6 - 1.3", "creatinine")
+    assert value == 1.1
+    assert confidence < RULE_CONFIDENCE_THRESHOLD
+
+
+def test_plain_layouts_keep_full_confidence():
+    text = "Hemoglobin: 13.2 g/dL\nPlatelets 2,50,000 /cumm\nWBC 7.2 x10^3/uL\nSGPT (ALT) 35 U/L"
+    assert parsed(text, "hemoglobin") == (13.2, 0.9)
+    assert parsed(text, "platelets") == (250000, 0.9)
+    assert parsed(text, "wbc") == (7200, 0.9)
+    assert parsed(text, "sgpt") == (35, 0.9)
+
+
+def test_dotted_and_spelled_out_labels():
+    text = (
+        "S.G.O.T 32 U/L\nS.G.P.T 30 U/L\nT.S.H 2.1 mIU/L\n"
+        "Blood Sugar (F) 98 mg/dL\nBlood Sugar (PP) 130 mg/dL"
+    )
+    assert parsed(text, "sgot") == (32, 0.9)
+    assert parsed(text, "sgpt") == (30, 0.9)
+    assert parsed(text, "tsh") == (2.1, 0.9)
+    assert parsed(text, "blood_sugar_fasting") == (98, 0.9)
+    assert parsed(text, "blood_sugar_pp") == (130, 0.9)
+
+
+def test_spelled_out_enzyme_and_hormone_names():
+    text = (
+        "Serum Glutamic Oxaloacetic Transaminase 32 U/L\n"
+        "Serum Glutamic Pyruvic Transaminase 30 U/L\nThyrotropin 2.1 mIU/L"
+    )
+    assert parsed(text, "sgot") == (32, 0.9)
+    assert parsed(text, "sgpt") == (30, 0.9)
+    assert parsed(text, "tsh") == (2.1, 0.9)
+
+
+def test_unrecognised_fields_still_go_to_the_llm():
+    text = "Hemoglobin 13.2 g/dL\nGamma Thyro Index 4"
+    _, confidence, _ = parseLabValues(text)
+    unresolved = unresolvedFields(text, confidence)
+    assert "hemoglobin" not in unresolved
+    assert set(unresolved) == set(LAB_FIELDS) - {"hemoglobin"}
+    assert unresolvedFields("  ", confidence) == []
@@ -1,96 +1,72 @@
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import os
-from langchain_qdrant import QdrantVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
-from qdrant_client import QdrantClient
-from pymongo import MongoClient
 import json
-from qdrant_client.models import Filter, FieldCondition, MatchValue,PayloadSchemaType
-from qdrant_client.http.exceptions import UnexpectedResponse
 import asyncio
+import pandas as pd
+from utils.database import getReports
+from utils.vectorStore import similaritySearch
+from utils.metricsStore import loadMetricsFrame
+from utils.healthIndicators import userIndicators, TREND_DAYS
+from utils.userData import getDataVersion, bumpDataVersion, getStoredSuggestions, storeSuggestions
 
 load_dotenv()
 
-async def analysis(input,username):
-    client = AsyncOpenAI(
+ANALYSIS_MODEL = "nvidia/nemotron-nano-12b-v2-vl:free"
+SUGGESTION_MODEL = "meta-llama/llama-3.3-70b-instruct:free"
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+def openRouterClient():
+    return AsyncOpenAI(
         api_key=os.getenv("OPENAI_API_KEY"),
-        base_url="https://openrouter.ai/api/v1"
+        base_url=OPENROUTER_BASE_URL
+    )
+
+async def streamCompletion(model,messages):
+    """Yields the completion's text as tokens arrive and prints the full text once done."""
+    client = openRouterClient()
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True
     )
 
+    parts = []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            parts.append(token)
+            yield token
+
+    print("Response:","".join(parts))
+
+async def analysisMessages(input,username):
+    """Saves the symptoms and builds the prompt from the closest report chunks."""
     try:
         print("Started")
-        uri = os.getenv("DATABASE_URL")
-        mongoClient = MongoClient(uri)
-
-        database = mongoClient["health"]
-        reports = database["Sources"]
+        reports = getReports()
 
         query_filter = {"user":username}
         update_operation = {"$set":
             {"symptoms":input}                  
         }
 
-        result = reports.update_one(query_filter, update_operation)
+        # Symptoms belong to the user's latest report, found through the (user, created_at) index
+        latest = await reports.find_one(query_filter, sort=[("created_at", -1)], projection={"_id": 1})
+        if latest is not None:
+            result = await reports.update_one({"_id": latest["_id"]}, update_operation)
+            # Resubmitting the same symptoms changes nothing, so cached suggestions stay valid
+            if result.modified_count > 0:
+                await bumpDataVersion(username)
         print("Ended")
     except Exception as e:
         raise Exception("The following error occurred: ", e)
-    finally:
-        if 'mongoClient' in locals():
-            mongoClient.close()
-
-    embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-
-    QDRANT_URL = os.getenv("VECTORDB_URL","http://localhost:6333")
-    QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-
-    qdrant_client = QdrantClient(
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY or None,   # works for both local (no key) and cloud
-    )
-
-    # ------------------------------------------------------------------
-    #  👉 QDRANT INDEX FIX (Added Here)
-    #  This is the necessary setup to resolve the "Index required" error.
-    #  It uses error handling to safely skip if the index already exists.
-    # ------------------------------------------------------------------
-    try:
-        qdrant_client.create_payload_index(
-            collection_name="ai_health_analysis",
-            field_name="user",
-            field_schema=PayloadSchemaType.KEYWORD,
-            # wait=True is useful to ensure the index is ready before proceeding
-            wait=True 
-        )
-        print("'user' keyword index created successfully.")
-    except UnexpectedResponse as e:
-        error_content = str(e).lower()
-        if "already exists" in error_content or "bad request" in error_content:
-            print("Keyword index already exists for 'user'. Skipping creation.")
-        else:
-            print(f"Failed to create index with an unexpected error: {e}")
-    except Exception as e:
-        print(f"A general exception occurred during index creation: {e}")
-    # ------------------------------------------------------------------
-
-    vector_db = QdrantVectorStore(
-        client=qdrant_client,
-        embedding=embedding,
-        collection_name="ai_health_analysis"
-    )
 
     print("Vector DB Semantic Search Started")
 
-    filter =Filter(
-        must=[
-            FieldCondition(
-                key="user",
-                match=MatchValue(value=username)
-            )
-        ]
-    )
-
-    search_results = await  vector_db.similarity_search(query=input,k=5,filter=filter)
+    search_results = await similaritySearch(input, username, k=5)
 
     print("Vector DB Semantic Search Ended")
 
@@ -109,94 +85,152 @@ async def analysis(input,username):
         Context:{context}
     """
 
+    return [
+        {"role":"system","content":SYSTEM_PROMPT},
+        {"role":"user","content":input}
+    ]
+
+async def analysis(input,username):
+    client = openRouterClient()
+    messages = await analysisMessages(input, username)
+
     response = await client.chat.completions.create(
-        model="nvidia/nemotron-nano-12b-v2-vl:free",
-        messages=[
-            {"role":"system","content":SYSTEM_PROMPT},
-            {"role":"user","content":input}
-        ]
+        model=ANALYSIS_MODEL,
+        messages=messages
     )
 
     print("Response:",response)
 
     return response.choices[0].message.content
 
-async def generateSuggestions(username):
-    client = AsyncOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url="https://openrouter.ai/api/v1"
-    )
-
-    uri = os.getenv("DATABASE_URL")
-    mongoClient = MongoClient(uri)
+async def analysisStream(input,username):
+    """Streaming variant of analysis: yields the answer token by token."""
+    messages = await analysisMessages(input, username)
+    async for token in streamCompletion(ANALYSIS_MODEL, messages):
+        yield token
+
+async def suggestionMessages(username):
+    """Builds the suggestion prompt from the user's last report and symptoms."""
+    reports = getReports()
+    report = await reports.find_one(
+        {"user":username},
+        sort=[("created_at", -1)],
+        projection={"raw_text": 1, "parsed_data": 1, "symptoms": 1}
+    ) or {}
+    raw_text = report.get("raw_text", "")
+    parsed_data = report.get("parsed_data", "")
+    symptoms = report.get("symptoms", None)
+
+    # Status against the reference ranges and the trend across all of the user's reports
+    indicators = userIndicators(await loadMetricsFrame(username))
+    trend = f"trend_per_{TREND_DAYS}d"
+    classifications = {
+        parameter: {
+            "value": round(float(row["latest"]), 3),
+            "unit": row["unit"],
+            "status": row["status"],
+            "distance_from_range": round(float(row["distance"]), 3),
+            f"trend_per_{TREND_DAYS}_days": None if pd.isna(row[trend]) else round(float(row[trend]), 3),
+            "reports": int(row["readings"]),
+        }
+        for parameter, row in indicators.iterrows()
+    }
 
-    try:
-        database = mongoClient["health"]
-        reports = database["Sources"]
-        results = reports.find({"user":username})
-        raw_text = ""
-        parsed_data= ""
-        symptoms = ""
-        for report in results:
-            raw_text = report.get("raw_text")
-            parsed_data = report.get("parsed_data")
-            symptoms = report.get("symptoms", None) 
-
-        SYSTEM_PROMPT = """
-            You are an AI assistant who is tasked to provide suggestion to the concerned user regarding their medical reports , symptoms and medical history
-
-            User would provide you the context in the below form : 
-            {
-                "text":"Medical History of the user in string",
-                "medical_params":
-                                {
-                    "blood_sugar_fasting": null or number,
-                    "blood_sugar_pp": null or number,
-                    "blood_pressure_systolic": null or number,
-                    "blood_pressure_diastolic": null or number,
-                    "hemoglobin": null or number,
-                    "rbc": null or number,
-                    "wbc": null or number,
-                    "platelets": null or number,
-                    "cholesterol_total": null or number,
-                    "hdl": null or number,
-                    "ldl": null or number,
-                    "triglycerides": null or number,
-                    "creatinine": null or number,
-                    "sgot": null or number,
-                    "sgpt": null or number,
-                    "tsh": null or number,
-                    "additional_notes": "string"
-                }
-                "symptoms":string
-            } 
-
-            Using the context passed provide the most suitable and appropraite suggestions that aligns with the users health care and well being
-
-            Rules :
-            - Do not hallucinate and advise the user for something we are not certain to advise
-            - Keep the tone of the message light and straight
-            - The suggestion should be generaed from the context provided only
-        """
-
-        information = json.dumps({
-            "text":raw_text,
-            "medical_params":parsed_data,
-            "symptoms":symptoms
-        })
-
-        print("Before Response",information)
-        response = await client.chat.completions.create(
-            model="meta-llama/llama-3.3-70b-instruct:free",
-            messages = [
-                {"role":"system","content":SYSTEM_PROMPT},
-                {"role":"user","content":information}
-            ]
-        )
-
-        return response.choices[0].message.content
-    finally:
-        mongoClient.close()
+    SYSTEM_PROMPT = f"""
+        You are an AI assistant who is tasked to provide suggestion to the concerned user regarding their medical reports , symptoms and medical history
+
+        User would provide you the context in the below form : 
+        {{
+            "text":"Medical History of the user in string",
+            "medical_params":
+                            {{
+                "blood_sugar_fasting": null or number,
+                "blood_sugar_pp": null or number,
+                "blood_pressure_systolic": null or number,
+                "blood_pressure_diastolic": null or number,
+                "hemoglobin": null or number,
+                "rbc": null or number,
+                "wbc": null or number,
+                "platelets": null or number,
+                "cholesterol_total": null or number,
+                "hdl": null or number,
+                "ldl": null or number,
+                "triglycerides": null or number,
+                "creatinine": null or number,
+                "sgot": null or number,
+                "sgpt": null or number,
+                "tsh": null or number,
+                "additional_notes": "string"
+            }}
+            "symptoms":string,
+            "indicators":
+                            {{
+                "<parameter>": {{
+                    "value": latest number,
+                    "unit": "string",
+                    "status": "Low" or "Normal" or "High",
+                    "distance_from_range": 0 inside the normal range, otherwise how far outside it in range widths (negative below),
+                    "trend_per_{TREND_DAYS}_days": change per {TREND_DAYS} days across the reports or null,
+                    "reports": number of reports with this parameter
+                }}
+            }}
+        }} 
+
+        Using the context passed provide the most suitable and appropraite suggestions that aligns with the users health care and well being
+
+        Rules :
+        - Do not hallucinate and advise the user for something we are not certain to advise
+        - Keep the tone of the message light and straight
+        - The suggestion should be generaed from the context provided only
+        - Rely on the status in "indicators" for whether a value is normal, and mention worsening trends
+    """
 
+    information = json.dumps({
+        "text":raw_text,
+        "medical_params":parsed_data,
+        "symptoms":symptoms,
+        "indicators":classifications
+    })
+
+    print("Before Response",information)
+    return [
+        {"role":"system","content":SYSTEM_PROMPT},
+        {"role":"user","content":information}
+    ]
+
+async def generateSuggestions(username,force=False):
+    """Returns suggestions for the user, reusing the stored ones until their data changes (or force=True)."""
+    data_version = await getDataVersion(username)
+    if not force:
+        stored = await getStoredSuggestions(username, data_version)
+        if stored is not None:
+            return stored
+
+    client = openRouterClient()
+    messages = await suggestionMessages(username)
 
+    response = await client.chat.completions.create(
+        model=SUGGESTION_MODEL,
+        messages = messages
+    )
 
+    text = response.choices[0].message.content
+    await storeSuggestions(username, data_version, text)
+    return text
+
+async def generateSuggestionsStream(username,force=False):
+    """Streaming variant of generateSuggestions: yields the suggestions token by token."""
+    data_version = await getDataVersion(username)
+    if not force:
+        stored = await getStoredSuggestions(username, data_version)
+        if stored is not None:
+            yield stored
+            return
+
+    messages = await suggestionMessages(username)
+    parts = []
+    async for token in streamCompletion(SUGGESTION_MODEL, messages):
+        parts.append(token)
+        yield token
+
+    await storeSuggestions(username, data_version, "".join(parts))
@@ -0,0 +1,150 @@
+from dotenv import load_dotenv
+import asyncio
+import os
+from utils.processPool import getProcessPool
+from utils.database import getReports
+from utils.vectorStore import addDocuments
+from utils.dedup import contentHash, duplicateOf, claimHash, removeReport, discardPartial
+from utils.extractTextFunction import loadDocument, parseReport, buildRecord, importStructured
+from utils.structuredImport import sniffTable, STRUCTURED_EXTENSIONS
+from utils.userData import bumpDataVersion
+from utils.metricsStore import saveMetrics
+from utils.stageTimer import StageTimer, runConcurrently
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+load_dotenv()
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+
+async def extractBatch(files,username,force=False,progress=None):
+    """Processes many uploads at once and returns one record per file.
+
+    `files` holds dicts with file_path, file_extension and file_name. Files are read in parallel
+    across processes, all chunks are embedded and upserted together, the Gemini calls overlap,
+    and the new records are written with a single insert_many.
+    """
+    progress = progress or (lambda stage, fraction: None)
+    progress("checking duplicates", 0.05)
+
+    reports = getReports()
+    hashes = await asyncio.gather(*[asyncio.to_thread(contentHash, file["file_path"]) for file in files])
+    existing = {}
+    async for report in reports.find({"user": username, "content_hash": {"$in": hashes}}):
+        existing[report["content_hash"]] = report
+
+    records = [None] * len(files)
+    pending = []
+    seen = set()
+    # Reports replaced by a forced reprocess; each is removed only once its replacement is saved
+    replaced = {}
+    for index, (file, content_hash) in enumerate(zip(files, hashes)):
+        previous = existing.get(content_hash)
+        if previous is not None and not force:
+            previous["duplicate"] = True
+            records[index] = previous
+            continue
+        if previous is not None:
+            replaced[content_hash] = existing.pop(content_hash)
+        # The same file can appear twice in one batch; process it once
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        # Tables of lab values skip chunking, embedding and Gemini entirely
+        file = files[index]
+        table = await asyncio.to_thread(sniffTable, file["file_path"]) if file["file_extension"] in STRUCTURED_EXTENSIONS else None
+        if table is not None:
+            records[index] = await importStructured(
+                file["file_path"], file["file_extension"], file["file_name"], username, content_hash, table, progress,
+                replaced.pop(content_hash, None),
+            )
+            continue
+        pending.append(index)
+
+    if pending:
+        progress("reading documents", 0.1)
+        loop = asyncio.get_running_loop()
+        pool = getProcessPool()
+        loaded = await asyncio.gather(*[
+            loop.run_in_executor(
+                pool,
+                loadDocument,
+                files[index]["file_path"],
+                files[index]["file_extension"],
+                files[index]["file_name"],
+                username,
+                hashes[index],
+            )
+            for index in pending
+        ])
+
+        progress("indexing and extracting lab values", 0.4)
+        all_documents = [doc for _, documents in loaded for doc in documents]
+        semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+        async def parse(extracted_text):
+            async with semaphore:
+                return await parseReport(extracted_text)
+
+        async def parseAll():
+            return await asyncio.gather(*[parse(text) for text, _ in loaded])
+
+        # Extraction only needs the text, so it runs while the chunks are embedded and upserted.
+        # Point ids are collected as they are upserted so a failed batch can delete them again.
+        timer = StageTimer()
+        indexed = []
+        record_ids = [ObjectId() for _ in pending]
+        try:
+            all_vector_ids, parsed_results = await runConcurrently(addDocuments(all_documents, timer, indexed), parseAll())
+            timer.report(f"Batch of {len(pending)}")
+
+            new_records = []
+            offset = 0
+            for index, record_id, (extracted_text, documents), (parsed_result, extraction) in zip(pending, record_ids, loaded, parsed_results):
+                vector_ids = all_vector_ids[offset:offset + len(documents)]
+                offset += len(documents)
+                file = files[index]
+                # Replacements are saved without their hash and claim it once the old report is gone
+                content_hash = None if hashes[index] in replaced else hashes[index]
+                record = buildRecord(username, file["file_name"], file["file_extension"], content_hash, vector_ids, extracted_text, parsed_result, extraction)
+                record["_id"] = record_id
+                records[index] = record
+                new_records.append(record)
+
+            progress("saving", 0.9)
+            try:
+                await reports.insert_many(new_records, ordered=False)
+            except BulkWriteError as e:
+                # Files another worker saved while this batch ran; every other record was still inserted
+                errors = e.details["writeErrors"]
+                failed = {error["index"] for error in errors if error["code"] == 11000}
+                if len(failed) < len(errors):
+                    raise
+                for position in sorted(failed):
+                    await discardPartial(new_records[position]["vector_ids"])
+                    records[pending[position]] = await duplicateOf(username, hashes[pending[position]])
+                new_records = [record for position, record in enumerate(new_records) if position not in failed]
+            await saveMetrics(new_records)
+        except Exception:
+            await discardPartial(indexed, record_ids)
+            raise
+
+        for previous in replaced.values():
+            await removeReport(previous)
+        for index in pending:
+            if hashes[index] in replaced:
+                records[index] = await claimHash(records[index], hashes[index])
+        await bumpDataVersion(username)
+        print(f"Saved {len(new_records)} reports on MongoDB ☑️")
+
+    # Repeated files in the batch share the record of their first occurrence
+    first_by_hash = {}
+    for index, content_hash in enumerate(hashes):
+        if records[index] is not None:
+            first_by_hash.setdefault(content_hash, records[index])
+    for index, content_hash in enumerate(hashes):
+        if records[index] is None:
+            records[index] = dict(first_by_hash[content_hash], duplicate=True)
+
+    return records
@@ -0,0 +1,59 @@
+from utils.database import runAsync, ensureIndexes, healthCheck
+from utils.vectorStore import ensureCollection
+from utils.metricsStore import backfillMetrics
+from utils.llmCache import pruneStale
+from utils.jobQueue import startWorkers
+from utils.extractTextFunction import EXTRACTION_MODEL, PROMPT_VERSION
+from dotenv import load_dotenv
+import threading
+import time
+import os
+
+load_dotenv()
+
+# After a failed bootstrap, page loads skip the retry for this long, doubling up to the maximum
+BOOTSTRAP_RETRY_SECONDS = float(os.getenv("BOOTSTRAP_RETRY_SECONDS", "5"))
+BOOTSTRAP_RETRY_MAX_SECONDS = float(os.getenv("BOOTSTRAP_RETRY_MAX_SECONDS", "60"))
+
+_done = False
+_failures = 0
+_retry_at = 0.0
+_lock = threading.Lock()
+
+
+def bootstrap():
+    """Runs the one-time schema setup for this process; later calls return immediately.
+
+    While MongoDB or Qdrant is down, a failed attempt is retried only after a backoff, so page
+    loads do not each block on the client timeouts.
+    """
+    global _done, _failures, _retry_at
+    if _done or time.monotonic() < _retry_at:
+        return
+    with _lock:
+        if _done or time.monotonic() < _retry_at:
+            return
+        try:
+            runAsync(ensureIndexes())
+            runAsync(ensureCollection())
+            backfilled = runAsync(backfillMetrics())
+            if backfilled:
+                print(f"Backfilled lab metrics for {backfilled} reports")
+            pruned = pruneStale(EXTRACTION_MODEL, PROMPT_VERSION)
+            if pruned:
+                print(f"Pruned {pruned} stale cached extractions")
+            # Jobs persisted before a restart resume without waiting for someone to open the upload page
+            startWorkers()
+        except ValueError:
+            # A schema mismatch will not fix itself, so stop here instead of failing every request
+            raise
+        except Exception as e:
+            # Leave _done unset so a page load after the backoff tries again
+            _failures += 1
+            delay = min(BOOTSTRAP_RETRY_SECONDS * 2 ** (_failures - 1), BOOTSTRAP_RETRY_MAX_SECONDS)
+            down = [name for name, status in runAsync(healthCheck()).items() if not status["ok"]]
+            print(f"Bootstrap failed ({', '.join(down) or 'services reachable'}): {e}; retrying in {delay:.0f}s")
+            _retry_at = time.monotonic() + delay
+            return
+        _done = True
+        print("Bootstrap complete")
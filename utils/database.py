@@ -0,0 +1,212 @@
+from pymongo import AsyncMongoClient
+from qdrant_client import AsyncQdrantClient
+from dotenv import load_dotenv
+import threading
+import inspect
+import asyncio
+import atexit
+import httpx
+import time
+import os
+
+load_dotenv()
+
+MONGO_DATABASE = "health"
+COLLECTION_NAME = "ai_health_analysis"
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+QDRANT_MAX_CONNECTIONS = int(os.getenv("QDRANT_MAX_CONNECTIONS", "20"))
+CLIENT_TIMEOUT_SECONDS = int(os.getenv("CLIENT_TIMEOUT_SECONDS", "10"))
+
+# The async clients are bound to the event loop they were first used on, so every
+# coroutine that touches them runs on this single process-wide loop
+_loop = None
+_mongo = None
+_qdrant = None
+_lock = threading.Lock()
+
+
+def _getLoop():
+    """Returns the background event loop, starting its thread on first use."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="data-access-loop", daemon=True).start()
+        return _loop
+
+
+def runAsync(coro, timeout=None):
+    """Runs a coroutine on the shared loop and blocks until it returns (use instead of asyncio.run)."""
+    return asyncio.run_coroutine_threadsafe(coro, _getLoop()).result(timeout)
+
+
+def iterateAsync(agen, timeout=None):
+    """Turns an async generator into a plain generator driven on the shared loop (e.g. for st.write_stream)."""
+    loop = _getLoop()
+
+    async def nextItem():
+        return await agen.__anext__()
+
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(nextItem(), loop).result(timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result(timeout)
+
+
+def getMongo():
+    """Returns the pooled async MongoDB client."""
+    global _mongo
+    with _lock:
+        if _mongo is None:
+            _mongo = AsyncMongoClient(
+                os.getenv("DATABASE_URL"),
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                serverSelectionTimeoutMS=CLIENT_TIMEOUT_SECONDS * 1000,
+            )
+        return _mongo
+
+
+def getDatabase():
+    return getMongo()[MONGO_DATABASE]
+
+
+def getReports():
+    """Returns the Sources collection holding one document per uploaded report."""
+    return getDatabase()["Sources"]
+
+
+def getMetrics():
+    """Returns the Metrics collection holding one compact row of lab values per report."""
+    return getDatabase()["Metrics"]
+
+
+def getUsers():
+    """Returns the Users collection holding per-user bookkeeping such as data_version."""
+    return getDatabase()["Users"]
+
+
+def getSuggestions():
+    """Returns the Suggestions collection holding the last generated suggestions per user."""
+    return getDatabase()["Suggestions"]
+
+
+def getQdrant():
+    """Returns the pooled async Qdrant client."""
+    global _qdrant
+    with _lock:
+        if _qdrant is None:
+            _qdrant = AsyncQdrantClient(
+                url=os.getenv("VECTORDB_URL", "http://localhost:6333"),
+                api_key=os.getenv("QDRANT_API_KEY") or None,  # works for both local (no key) and cloud
+                timeout=CLIENT_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=QDRANT_MAX_CONNECTIONS,
+                    max_keepalive_connections=QDRANT_MAX_CONNECTIONS,
+                ),
+            )
+        return _qdrant
+
+
+def useClients(mongo=None, qdrant=None):
+    """Replaces the pooled clients, e.g. with in-memory stand-ins for offline benchmarks."""
+    global _mongo, _qdrant
+    with _lock:
+        if mongo is not None:
+            _mongo = mongo
+        if qdrant is not None:
+            _qdrant = qdrant
+
+
+async def ensureIndexes():
+    """Creates the indexes every query path relies on and backfills missing report timestamps."""
+    reports = getReports()
+    # Reports saved before created_at existed get the insertion time recorded in their ObjectId
+    await reports.update_many(
+        {"created_at": {"$exists": False}},
+        [{"$set": {"created_at": {"$toDate": "$_id"}}}],
+    )
+    await reports.create_index([("user", 1), ("created_at", -1)], name="user_created_at")
+    await ensureUniqueContentHash(reports)
+    await getMetrics().create_index([("user", 1), ("created_at", 1)], name="user_created_at")
+    await getMetrics().create_index("report_id", unique=True, name="report_id")
+    await getMetrics().create_index("source_id", sparse=True, name="source_id")
+    await getUsers().create_index("user", unique=True, name="user")
+    await getSuggestions().create_index("user", unique=True, name="user")
+
+
+async def ensureUniqueContentHash(reports):
+    """Makes (user, content_hash) unique, so two workers saving the same upload cannot both succeed.
+
+    Only string hashes are indexed, which lets a forced reprocess save its record without one until
+    the report it replaces is gone. Duplicates saved before the index existed keep their report,
+    but only the newest of them keeps its hash.
+    """
+    indexes = await reports.index_information()
+    if "user_content_hash" in indexes and not indexes["user_content_hash"].get("unique"):
+        await reports.drop_index("user_content_hash")
+
+    cursor = await reports.aggregate([
+        {"$match": {"content_hash": {"$type": "string"}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": {"user": "$user", "content_hash": "$content_hash"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ])
+    async for group in cursor:
+        await reports.update_many({"_id": {"$in": group["ids"][1:]}}, {"$set": {"content_hash": None}})
+
+    await reports.create_index(
+        [("user", 1), ("content_hash", 1)],
+        name="user_content_hash",
+        unique=True,
+        partialFilterExpression={"content_hash": {"$type": "string"}},
+    )
+
+
+async def healthCheck():
+    """Pings MongoDB and Qdrant and returns the status and latency of each."""
+    async def probe(check):
+        start = time.perf_counter()
+        try:
+            await check()
+            return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    # Both run at once, so a down service costs one client timeout rather than two
+    mongodb, qdrant = await asyncio.gather(
+        probe(lambda: getMongo().admin.command("ping")),
+        probe(lambda: getQdrant().get_collections()),
+    )
+    return {"mongodb": mongodb, "qdrant": qdrant}
+
+
+async def closeClients():
+    """Closes both clients; the next getMongo/getQdrant call opens fresh ones."""
+    global _mongo, _qdrant
+    with _lock:
+        mongo, qdrant = _mongo, _qdrant
+        _mongo, _qdrant = None, None
+
+    for client in (mongo, qdrant):
+        if client is not None:
+            # Stand-ins injected through useClients may close synchronously
+            closing = client.close()
+            if inspect.isawaitable(closing):
+                await closing
+
+
+@atexit.register
+def _shutdown():
+    if _loop is None or not _loop.is_running():
+        return
+    try:
+        runAsync(closeClients(), timeout=CLIENT_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"Failed to close database clients cleanly: {e}")
+    finally:
+        _loop.call_soon_threadsafe(_loop.stop)
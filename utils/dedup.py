@@ -0,0 +1,70 @@
+from utils.database import getReports, getMetrics
+from utils.vectorStore import deletePoints
+from pymongo.errors import DuplicateKeyError
+import hashlib
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def contentHash(file_path):
+    """Returns the sha256 of the file contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def findDuplicate(username, content_hash):
+    """Returns the user's existing Sources record for this content, or None."""
+    return await getReports().find_one({"user": username, "content_hash": content_hash})
+
+
+async def duplicateOf(username, content_hash):
+    """Returns the record another upload of this content saved first, marked as a duplicate.
+
+    Called after an insert or claimHash hit the unique (user, content_hash) index.
+    """
+    existing = await findDuplicate(username, content_hash)
+    if existing is None:
+        raise Exception("The same file was saved by another upload and removed again; please retry")
+    existing["duplicate"] = True
+    return existing
+
+
+async def claimHash(record, content_hash):
+    """Sets content_hash on a saved record that replaced an older report and was stored without it.
+
+    Returns the record, or, when another upload of the same content claimed the hash first,
+    removes this one and returns that upload's record instead.
+    """
+    try:
+        await getReports().update_one({"_id": record["_id"]}, {"$set": {"content_hash": content_hash}})
+    except DuplicateKeyError:
+        await removeReport(record)
+        return await duplicateOf(record["user"], content_hash)
+    record["content_hash"] = content_hash
+    return record
+
+
+async def removeReport(record):
+    """Deletes a previously processed report together with its vectors."""
+    await deletePoints(record.get("vector_ids", []))
+    # Imported tables own one Metrics row per reading through source_id
+    await getMetrics().delete_many({"$or": [{"report_id": record["_id"]}, {"source_id": record["_id"]}]})
+    await getReports().delete_one({"_id": record["_id"]})
+
+
+async def discardPartial(point_ids, record_ids=()):
+    """Deletes what a failed ingestion left behind: its points and any Sources / Metrics rows already written.
+
+    Errors are only printed, so the caller can re-raise the failure that got it here.
+    """
+    try:
+        await deletePoints(point_ids)
+        record_ids = list(record_ids)
+        if record_ids:
+            await getMetrics().delete_many({"$or": [{"report_id": {"$in": record_ids}}, {"source_id": {"$in": record_ids}}]})
+            await getReports().delete_many({"_id": {"$in": record_ids}})
+    except Exception as e:
+        print(f"Cleanup after a failed ingestion did not finish: {e}")
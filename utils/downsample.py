@@ -0,0 +1,98 @@
+from dotenv import load_dotenv
+import pandas as pd
+import numpy as np
+import os
+
+load_dotenv()
+
+# Upper bound on the points one trend series sends to the browser
+TREND_POINT_BUDGET = int(os.getenv("TREND_POINT_BUDGET", "500"))
+# Upper bound on the outliers one box plot shows beyond its whiskers
+BOX_OUTLIER_BUDGET = int(os.getenv("BOX_OUTLIER_BUDGET", "50"))
+
+
+def lttb(x, y, budget):
+    """Largest-Triangle-Three-Buckets: returns the indices of `budget` points that keep the series' shape.
+
+    The first and last points are always kept; every bucket in between contributes the point that
+    forms the largest triangle with the previously kept point and the average of the next bucket.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if budget >= n or n <= 2:
+        return np.arange(n)
+    budget = max(budget, 3)
+
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+    kept = np.empty(budget, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(budget - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_start, next_stop = stop, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_start:next_stop].mean()
+        next_y = y[next_start:next_stop].mean()
+        # Twice the triangle areas for every candidate in the bucket at once
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsampleSeries(x, y, budget=TREND_POINT_BUDGET, low=None, high=None):
+    """Returns the indices to plot for a series of about `budget` points, in order.
+
+    On top of the LTTB selection the global minimum and maximum are always kept, and so are the
+    points outside [low, high]; when those alone exceed half the budget they are thinned with
+    LTTB among themselves so the total stays bounded.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= budget:
+        return np.arange(n)
+
+    keep = [np.array([0, n - 1, int(np.argmin(y)), int(np.argmax(y))])]
+    if low is not None and high is not None:
+        outside = np.flatnonzero((y < low) | (y > high))
+        if len(outside) > budget // 2:
+            outside = outside[lttb(np.asarray(x, dtype=np.float64)[outside], y[outside], budget // 2)]
+        keep.append(outside)
+    remaining = max(budget - sum(len(indices) for indices in keep), 3)
+    keep.append(lttb(x, y, remaining))
+    return np.unique(np.concatenate(keep))
+
+
+def boxStatistics(df, outlier_budget=BOX_OUTLIER_BUDGET):
+    """Precomputed Tukey box-plot statistics per column, so the chart needs five numbers instead of every value.
+
+    Whiskers reach the most extreme values within 1.5 IQR of the quartiles, as Plotly draws them.
+    The values beyond the whiskers are kept in "outliers", the most extreme first and at most
+    `outlier_budget` per column, so the clinically relevant extremes still show.
+    """
+    q1, median, q3 = df.quantile(0.25), df.median(), df.quantile(0.75)
+    iqr = q3 - q1
+    lower = df.where(df >= q1 - 1.5 * iqr).min()
+    upper = df.where(df <= q3 + 1.5 * iqr).max()
+
+    outliers = {}
+    for column in df.columns:
+        values = df[column].dropna().to_numpy(dtype=np.float64)
+        beyond = values[(values < lower[column]) | (values > upper[column])]
+        # Rank by distance past the nearer whisker, so both tails keep their extremes
+        distance = np.maximum(lower[column] - beyond, beyond - upper[column])
+        outliers[column] = np.sort(beyond[np.argsort(-distance, kind="stable")[:outlier_budget]]).tolist()
+
+    return pd.DataFrame({
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "lowerfence": lower,
+        "upperfence": upper,
+        "mean": df.mean(),
+        "count": df.count(),
+        "outliers": pd.Series(outliers, dtype=object),
+    })
@@ -0,0 +1,165 @@
+from langchain_core.embeddings import Embeddings
+from contextlib import closing
+from dotenv import load_dotenv
+from pathlib import Path
+import numpy as np
+import threading
+import hashlib
+import sqlite3
+import time
+import os
+
+load_dotenv()
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", DATA_DIR / "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# Cache hits are remembered in memory and written to last_used at most this often
+EMBEDDING_CACHE_TOUCH_SECONDS = float(os.getenv("EMBEDDING_CACHE_TOUCH_SECONDS", "60"))
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model with an on-disk LRU cache keyed by model name and text hash.
+
+    Vectors are stored as float32 blobs in SQLite. Once the cache holds more than
+    EMBEDDING_CACHE_MAX_ENTRIES rows, the least recently used ones are evicted down to 90% of
+    the bound, so the eviction query runs once per batch of inserts rather than on every store.
+    """
+
+    def __init__(self, embedding, model_name, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._last_flush = time.monotonic()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            # Counted once here and kept up to date by _store; INSERT OR REPLACE can overcount,
+            # which only makes eviction recount early
+            self._entries = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _key(self, text, kind="document"):
+        # Some models embed queries differently from documents, so the two never share entries
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        with closing(self._connect()) as connection:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update({key: np.frombuffer(vector, dtype=np.float32).tolist() for key, vector in rows})
+            if found:
+                now = time.time()
+                with self._lock:
+                    self._touched.update(dict.fromkeys(found, now))
+                    due = time.monotonic() - self._last_flush >= EMBEDDING_CACHE_TOUCH_SECONDS
+                if due:
+                    self._flushTouches(connection)
+        return found
+
+    def _flushTouches(self, connection):
+        """Writes the buffered cache hits to last_used in one statement."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.monotonic()
+        if touched:
+            connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(used, key) for key, used in touched.items()]
+            )
+
+    def _store(self, entries):
+        entries = list(entries)
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in entries],
+            )
+            with self._lock:
+                self._entries += len(entries)
+                over = self._entries > self.max_entries
+            if not over:
+                return
+
+            # Recount, since replaced keys and other processes make the counter approximate
+            count = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                # Pending hits go in first so recently used vectors are not evicted
+                self._flushTouches(connection)
+                keep = int(self.max_entries * 0.9)
+                connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (keep,),
+                )
+                count = min(count, keep)
+            with self._lock:
+                self._entries = count
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+
+        if missing:
+            vectors = self.embedding.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed.items())
+            cached.update(computed)
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self._key(text, kind="query")
+        cached = self._lookup([key])
+        with self._lock:
+            if key in cached:
+                self.hits += 1
+                return cached[key]
+            self.misses += 1
+
+        vector = self.embedding.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+    def stats(self):
+        """Returns hit/miss counts since startup and the number of cached vectors."""
+        with closing(self._connect()) as connection:
+            entries = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
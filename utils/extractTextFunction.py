@@ -1,29 +1,121 @@
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from PIL import Image
-import easyocr
-from langchain_huggingface import HuggingFaceEmbeddings
 import os
 from langchain_core.documents import Document
 from dotenv import load_dotenv
-from langchain_qdrant import QdrantVectorStore
 from openai import AsyncOpenAI
-from pymongo import MongoClient
-from qdrant_client import QdrantClient
 import json
 import asyncio
+from datetime import datetime, timezone
+from utils.models import getReader
+from utils.database import getReports, getMetrics
+from utils.vectorStore import addDocuments
+from utils.dedup import contentHash, findDuplicate, duplicateOf, claimHash, removeReport, discardPartial
+from utils.userData import bumpDataVersion
+from utils.metricsStore import saveMetrics
+from utils.ocrPreprocess import preprocessFile
+from utils.scannedPdf import isScanned, ocrPage, ocrPages, reportTimings
+from utils.labParser import parseLabValues, unresolvedFields, LAB_FIELDS, RULE_CONFIDENCE_THRESHOLD
+from utils.llmCache import promptVersion, extractionKey, getCached, putCached
+from utils.structuredImport import importTable, sniffTable, STRUCTURED_EXTENSIONS
+from utils.stageTimer import StageTimer, stageOf, runConcurrently
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from pypdf import PdfReader
 
 load_dotenv()
 
-async def extractText(file_path,file_extension,file_name,username):
-    QDRANT_URL = os.getenv("VECTORDB_URL", "http://localhost:6333")
-    QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# Streaming PDF ingestion: pages are indexed in windows of at most PDF_WINDOW_PAGES pages or
+# PDF_WINDOW_MAX_BYTES of text, whichever fills first, so memory stays flat for long files.
+# Only the first PDF_TEXT_LIMIT characters are kept for the Gemini extraction and raw_text.
+PDF_WINDOW_PAGES = int(os.getenv("PDF_WINDOW_PAGES", "10"))
+PDF_WINDOW_MAX_BYTES = int(os.getenv("PDF_WINDOW_MAX_BYTES", str(2 * 1024 * 1024)))
+PDF_TEXT_LIMIT = int(os.getenv("PDF_TEXT_LIMIT", "100000"))
+
+EXTRACTION_MODEL = "gemini-2.5-flash"
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai")
+
+
+SYSTEM_PROMPT = """
+    You are an AI assistant that is has a task to extract the medical data from the field 
+    You need to extract all the medical report information from the uploaded PDF,Image,Text from the user
+
+    Always output the valid json with this fields:
+    {
+        "blood_sugar_fasting": null or number,
+        "blood_sugar_pp": null or number,
+        "blood_pressure_systolic": null or number,
+        "blood_pressure_diastolic": null or number,
+        "hemoglobin": null or number,
+        "rbc": null or number,
+        "wbc": null or number,
+        "platelets": null or number,
+        "cholesterol_total": null or number,
+        "hdl": null or number,
+        "ldl": null or number,
+        "triglycerides": null or number,
+        "creatinine": null or number,
+        "sgot": null or number,
+        "sgpt": null or number,
+        "tsh": null or number,
+        "additional_notes": "string"
+    }
+
+    Rules :
+    - If the value is missing in the report keep it null
+    - Do not hallucinate the values if the values is not clear write null
+    - Convert the units to basic numeric format
+    - Extract from the reports provided in the reports
+    - Do not include the text outside of the JSON
+    - if any additional important information add it in the paramter additional_notes which is a string 
+    - Don't change the parameters and follow the rules strictly
+
+    Example :
+    Q: Ouput of the Medical Report uploaded by the user :
+    A : 
+        {
+            "blood_sugar_fasting": 98,
+            "blood_sugar_pp": 132,
+            "blood_pressure_systolic": 120,
+            "blood_pressure_diastolic": 80,
+            "hemoglobin": 14.2,
+            "rbc": 4.8,
+            "wbc": 6200,
+            "platelets": 210000,
+            "cholesterol_total": 176,
+            "hdl": 48,
+            "ldl": 102,
+            "triglycerides": 150,
+            "creatinine": 1.0,
+            "sgot": 32,
+            "sgpt": 30,
+            "tsh": 2.1,
+            "additional_notes": "Report indicates normal levels."
+        }
+
+    """
+
+# Cached extractions are keyed by this, so editing SYSTEM_PROMPT invalidates them
+PROMPT_VERSION = promptVersion(SYSTEM_PROMPT)
+
+
+def loadDocument(file_path,file_extension,file_name,username,content_hash):
+    """Reads the text out of a PDF, image or text file and splits it into chunks for indexing."""
     documents = []
     extracted_text =""
     if file_extension == "pdf":
         loader = PyPDFLoader(file_path)
         docs = loader.load()
 
+        # Scanned pages carry no text layer, so read them with OCR instead
+        timings = []
+        for d in docs:
+            if isScanned(d.page_content):
+                _, d.page_content, seconds = ocrPage(file_path, d.metadata["page"])
+                timings.append((d.metadata["page"], seconds))
+        reportTimings(timings)
+
         extracted_text = "\n".join([d.page_content for d in docs])
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000, chunk_overlap=200, 
@@ -32,10 +124,12 @@ async def extractText(file_path,file_extension,file_name,username):
         documents = text_splitter.split_documents(docs)
         for doc in documents:
             doc.metadata["user"] = username
+            doc.metadata["content_hash"] = content_hash
 
     elif file_extension in ["jpg", "jpeg", "png"]:
-        reader = easyocr.Reader(['en'])
-        results = reader.readtext(file_path,detail=0)
+        reader = getReader()
+        # Downscaled, grayscale and straightened first; raw phone photos take far longer to OCR
+        results = reader.readtext(preprocessFile(file_path),detail=0)
         extracted_text = "\n".join(results)
 
         text_splitter = RecursiveCharacterTextSplitter(
@@ -45,135 +139,317 @@ async def extractText(file_path,file_extension,file_name,username):
         chunks = text_splitter.split_text(extracted_text)
 
         documents = [
-            Document(page_content=chunk, metadata={"source": file_name,"user": username})
+            Document(page_content=chunk, metadata={"source": file_name,"user": username,"content_hash": content_hash})
+            for chunk in chunks
+        ]
+
+    elif file_extension in STRUCTURED_EXTENSIONS:
+        # Text that is not a table of lab values goes through the same pipeline as a report
+        with open(file_path, encoding="utf-8-sig", errors="replace") as f:
+            extracted_text = f.read()
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000, chunk_overlap=200, 
+        )
+
+        chunks = text_splitter.split_text(extracted_text)
+
+        documents = [
+            Document(page_content=chunk, metadata={"source": file_name,"user": username,"content_hash": content_hash})
             for chunk in chunks
         ]
 
     else :
         raise Exception("File Type not Supported")
-    
-    embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
 
-    print(QDRANT_URL)
+    return extracted_text, documents
+
+
+async def askGemini(extracted_text,fields):
+    """Asks Gemini to fill the lab parameter schema from the report text, limited to `fields`.
+
+    Results are cached by normalized text, model, prompt version and fields, so reprocessing
+    the same report does not pay for the call again.
+    """
+    cache_key = extractionKey(extracted_text, EXTRACTION_MODEL, PROMPT_VERSION, fields)
+    cached = await asyncio.to_thread(getCached, cache_key)
+    if cached is not None:
+        print("Using cached Gemini extraction")
+        return cached
 
-    qdrant_client = QdrantClient(
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY or None,  
+    client = AsyncOpenAI(
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        base_url=GEMINI_BASE_URL
     )
-    print("fine")
-    vector_store = QdrantVectorStore(
-        client=qdrant_client,
-        collection_name="ai_health_analysis",
-        embedding=embedding,
+
+    messages = [{"role":"system","content":SYSTEM_PROMPT}]
+    if len(fields) < len(LAB_FIELDS):
+        messages.append({"role":"system","content":f"Only these fields are needed, keep every other lab field null but still fill additional_notes: {', '.join(fields)}"})
+    messages.append({"role":"user","content":extracted_text})
+
+    response = await client.chat.completions.create(
+        model=EXTRACTION_MODEL,
+        response_format={"type":"json_object"},
+        messages=messages,
     )
-    await vector_store.add_documents(documents=documents)
-    # QdrantVectorStore.from_documents(
-    #     client=qdrant_client,
-    #     documents=documents,
-    #     embedding=embedding,
-    #     collection_name="ai_health_analysis",
-    #     force_recreate=False
-    # )
-
-    print("Indexing Done")
-
-    uri = os.getenv("DATABASE_URL")
-    mongoClient = MongoClient(uri)
-
-    try:   
-        client = AsyncOpenAI(
-            api_key=os.getenv("GOOGLE_API_KEY"),
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai"
-        )
-        
-        SYSTEM_PROMPT = """
-            You are an AI assistant that is has a task to extract the medical data from the field 
-            You need to extract all the medical report information from the uploaded PDF,Image,Text from the user
-
-            Always output the valid json with this fields:
-            {
-                "blood_sugar_fasting": null or number,
-                "blood_sugar_pp": null or number,
-                "blood_pressure_systolic": null or number,
-                "blood_pressure_diastolic": null or number,
-                "hemoglobin": null or number,
-                "rbc": null or number,
-                "wbc": null or number,
-                "platelets": null or number,
-                "cholesterol_total": null or number,
-                "hdl": null or number,
-                "ldl": null or number,
-                "triglycerides": null or number,
-                "creatinine": null or number,
-                "sgot": null or number,
-                "sgpt": null or number,
-                "tsh": null or number,
-                "additional_notes": "string"
-            }
-
-            Rules :
-            - If the value is missing in the report keep it null
-            - Do not hallucinate the values if the values is not clear write null
-            - Convert the units to basic numeric format
-            - Extract from the reports provided in the reports
-            - Do not include the text outside of the JSON
-            - if any additional important information add it in the paramter additional_notes which is a string 
-            - Don't change the parameters and follow the rules strictly
-
-            Example :
-            Q: Ouput of the Medical Report uploaded by the user :
-            A : 
-                {
-                    "blood_sugar_fasting": 98,
-                    "blood_sugar_pp": 132,
-                    "blood_pressure_systolic": 120,
-                    "blood_pressure_diastolic": 80,
-                    "hemoglobin": 14.2,
-                    "rbc": 4.8,
-                    "wbc": 6200,
-                    "platelets": 210000,
-                    "cholesterol_total": 176,
-                    "hdl": 48,
-                    "ldl": 102,
-                    "triglycerides": 150,
-                    "creatinine": 1.0,
-                    "sgot": 32,
-                    "sgpt": 30,
-                    "tsh": 2.1,
-                    "additional_notes": "Report indicates normal levels."
-                }
 
+    print(response)
+
+    result = json.loads((response.choices[0].message.content).strip())
+    await asyncio.to_thread(putCached, cache_key, EXTRACTION_MODEL, PROMPT_VERSION, result)
+    return result
+
+
+async def parseReport(extracted_text):
+    """Fills the lab parameter schema, trying the local rule-based parser before Gemini.
+
+    Gemini is asked for every field that could not be read confidently, including those whose
+    label the patterns do not know, and for the additional notes; it is skipped only when all
+    fields resolved locally. Returns (parsed_result, extraction) where extraction holds
+    per-field confidence.
     """
+    # The regular expressions take a noticeable time on long reports, so they run off the loop
+    values, confidence, _ = await asyncio.to_thread(parseLabValues, extracted_text)
+    resolved = {field for field in LAB_FIELDS if confidence[field] >= RULE_CONFIDENCE_THRESHOLD}
+    unresolved = unresolvedFields(extracted_text, confidence)
 
-        response = await client.chat.completions.create(
-            model="gemini-2.5-flash",
-            response_format={"type":"json_object"},
-            messages=[
-                {"role":"system","content":SYSTEM_PROMPT},
-                {"role":"user","content":extracted_text}
-            ],
-        )
+    parsed_result = {field: values[field] if field in resolved else None for field in LAB_FIELDS}
+    parsed_result["additional_notes"] = ""
+
+    if unresolved:
+        llm_result = await askGemini(extracted_text, unresolved)
+        for field in unresolved:
+            parsed_result[field] = llm_result.get(field)
+        parsed_result["additional_notes"] = llm_result.get("additional_notes") or ""
+    else:
+        print("All lab values resolved locally, skipping Gemini")
+
+    extraction = {
+        "confidence": {field: round(confidence[field], 2) if field in resolved else None for field in LAB_FIELDS},
+        "llm_fields": unresolved,
+    }
+    return parsed_result, extraction
+
+
+async def streamPdf(file_path,username,content_hash,progress,text_ready,timer=None,indexed=None):
+    """Loads, chunks, embeds and upserts a PDF window by window.
+
+    The text kept for extraction is handed to `text_ready` (a future) as soon as it is complete,
+    i.e. once PDF_TEXT_LIMIT characters were read or the last page was, so Gemini can start while
+    the remaining windows are still being indexed. Returns the ids of every indexed chunk; they are
+    also appended to `indexed` as they are upserted (see addDocuments).
+    """
+    total_pages = max(await asyncio.to_thread(lambda: len(PdfReader(file_path).pages)), 1)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=200, 
+    )
+
+    kept_text = []
+    kept_chars = 0
+    vector_ids = []
+    ocr_timings = []
+    window = []
+    window_bytes = 0
+    pages_done = 0
+    indexing = None
+
+    def publishText():
+        if not text_ready.done():
+            text_ready.set_result("\n".join(kept_text))
+
+    async def index(documents, pages):
+        vector_ids.extend(await addDocuments(documents, timer, indexed))
+        progress(f"indexing page {pages}/{total_pages}", 0.1 + 0.5 * pages / total_pages)
+
+    async def flush():
+        nonlocal window, window_bytes, pages_done, kept_chars, indexing
+        # Scanned pages in the window are OCR'd in parallel, then merged back in page order
+        scanned = [page.metadata["page"] for page in window if isScanned(page.page_content)]
+        with stageOf(timer, "ocr"):
+            ocr_texts, timings = await ocrPages(file_path, scanned)
+        ocr_timings.extend(timings)
+        for page in window:
+            page.page_content = ocr_texts.get(page.metadata["page"], page.page_content)
+            if kept_chars < PDF_TEXT_LIMIT:
+                kept_text.append(page.page_content[:PDF_TEXT_LIMIT - kept_chars])
+                kept_chars += len(kept_text[-1])
+        if kept_chars >= PDF_TEXT_LIMIT:
+            publishText()
+
+        documents = await asyncio.to_thread(text_splitter.split_documents, window)
+        for doc in documents:
+            doc.metadata["user"] = username
+            doc.metadata["content_hash"] = content_hash
+        pages_done += len(window)
+        window, window_bytes = [], 0
+
+        # The next window is read and OCR'd while this one is indexed; at most one is in flight
+        if indexing is not None:
+            await indexing
+        indexing = asyncio.create_task(index(documents, pages_done))
+
+    try:
+        pages = PyPDFLoader(file_path).lazy_load()
+        while True:
+            # pypdf's text extraction is CPU bound, so it runs off the event loop
+            with stageOf(timer, "load"):
+                page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            window.append(page)
+            window_bytes += len(page.page_content.encode("utf-8"))
+            if len(window) >= PDF_WINDOW_PAGES or window_bytes >= PDF_WINDOW_MAX_BYTES:
+                await flush()
+
+        if window:
+            await flush()
+        publishText()
+        if indexing is not None:
+            await indexing
+    except BaseException:
+        if indexing is not None:
+            indexing.cancel()
+        raise
+    reportTimings(ocr_timings)
+
+    return vector_ids
+
+
+def buildRecord(username,file_name,file_extension,content_hash,vector_ids,extracted_text,parsed_result,extraction=None):
+    return {
+        "user":username,
+        "file_name": file_name,
+        "file_type": file_extension,
+        "content_hash": content_hash,
+        "vector_ids": vector_ids,
+        "raw_text": extracted_text,
+        "parsed_data": parsed_result,
+        "extraction": extraction,
+        "created_at": datetime.now(timezone.utc),
+        "metrics_written": True
+    }
+
+
+async def importStructured(file_path,file_extension,file_name,username,content_hash,table,progress,existing=None):
+    """Imports a table of lab values straight into Metrics, without embedding or Gemini.
+
+    `existing` is the report a forced reprocess replaces; it is removed once the import is saved.
+    """
+    record_id = ObjectId()
+    parsed_result, extraction, summary = await importTable(file_path, table, username, record_id, progress)
+
+    # A replacement is saved without its hash, which it claims once the old report is gone
+    record = buildRecord(username, file_name, file_extension, content_hash if existing is None else None, [], summary, parsed_result, extraction)
+    record["_id"] = record_id
+    progress("saving", 0.9)
+    try:
+        await getReports().insert_one(record)
+    except DuplicateKeyError:
+        # Another worker saved the same file while this one imported it; keep theirs
+        await getMetrics().delete_many({"source_id": record_id})
+        return await duplicateOf(username, content_hash)
+    except Exception:
+        await getMetrics().delete_many({"source_id": record_id})
+        raise
+    if existing is not None:
+        await removeReport(existing)
+        record = await claimHash(record, content_hash)
+    await bumpDataVersion(username)
+
+    print("Saved on MongoDB ☑️")
+    return record
+
+
+async def extractText(file_path,file_extension,file_name,username,force=False,progress=None):
+    # progress(stage, fraction) lets the job queue report how far the upload got
+    progress = progress or (lambda stage, fraction: None)
+    progress("checking duplicates", 0.05)
+
+    # Skip the whole pipeline when this user already uploaded the same file. A forced reprocess
+    # removes the old report only once the new one is saved, so a failed run leaves it in place.
+    content_hash = await asyncio.to_thread(contentHash, file_path)
+    existing = await findDuplicate(username, content_hash)
+    if existing is not None and not force:
+        print("Duplicate upload, returning the existing report")
+        existing["duplicate"] = True
+        return existing
+
+    progress("reading document", 0.1)
+    table = await asyncio.to_thread(sniffTable, file_path) if file_extension in STRUCTURED_EXTENSIONS else None
+    if table is not None:
+        return await importStructured(file_path, file_extension, file_name, username, content_hash, table, progress, existing)
+
+    # Stage graph: reading feeds both indexing (embed + upsert) and the lab value extraction,
+    # which only needs the text, so the two run concurrently and the run takes about as long as
+    # the slower of them. CPU-bound reading, OCR and embedding run in executors, off the loop.
+    timer = StageTimer()
+
+    async def extractValues(extracted_text):
+        try:
+            with timer.stage("parse"):
+                return await parseReport(extracted_text)
+        except Exception as e:
+            raise Exception("Unable to find the document due to the following error: ", e)
+
+    # Every point id is collected as it is upserted, so a run that fails after indexing started
+    # deletes its points (and anything it saved) instead of leaving orphans for a retry to duplicate
+    indexed = []
+    record_id = ObjectId()
+    try:
+        progress("indexing and extracting lab values", 0.2)
+        if file_extension == "pdf":
+            text_ready = asyncio.get_running_loop().create_future()
+
+            async def extractWhenReady():
+                extracted_text = await text_ready
+                return extracted_text, await extractValues(extracted_text)
 
-        print(response)
+            vector_ids, (extracted_text, (parsed_result, extraction)) = await runConcurrently(
+                streamPdf(file_path, username, content_hash, progress, text_ready, timer, indexed),
+                extractWhenReady(),
+            )
+        else:
+            # The models are already warm in this process, so a thread beats a cold worker process here
+            with timer.stage("load"):
+                extracted_text, documents = await asyncio.to_thread(
+                    loadDocument, file_path, file_extension, file_name, username, content_hash
+                )
 
-        parsed_result = json.loads((response.choices[0].message.content).strip())
+            vector_ids, (parsed_result, extraction) = await runConcurrently(
+                addDocuments(documents, timer, indexed),
+                extractValues(extracted_text),
+            )
 
-        database = mongoClient["health"]
-        reports = database["Sources"]
+        print("Indexing Done")
 
-        reports.insert_one({
-            "user":username,
-            "file_name": file_name,
-            "file_type": file_extension,
-            "raw_text": extracted_text,
-            "parsed_data": parsed_result
-        })
+        reports = getReports()
 
+        # A replacement is saved without its hash, which it claims once the old report is gone
+        record = buildRecord(username, file_name, file_extension, content_hash if existing is None else None, vector_ids, extracted_text, parsed_result, extraction)
+        record["_id"] = record_id
+        # Busy seconds per stage up to here; "total" is the wall-clock time before saving
+        record["timings"] = timer.summary()
+        progress("saving", 0.9)
+        try:
+            with timer.stage("save"):
+                await reports.insert_one(record)
+                await saveMetrics([record])
+        except DuplicateKeyError:
+            # Another worker saved the same file while this one processed it; keep theirs
+            await discardPartial(indexed, [record_id])
+            return await duplicateOf(username, content_hash)
+        except Exception as e:
+            raise Exception("Unable to find the document due to the following error: ", e)
+    except Exception:
+        await discardPartial(indexed, [record_id])
+        raise
 
-        print("Saved on MongoDB ☑️")
-    except Exception as e:
-        raise Exception("Unable to find the document due to the following error: ", e)
-    finally:
-        mongoClient.close()
-    
+    with timer.stage("save"):
+        if existing is not None:
+            await removeReport(existing)
+            record = await claimHash(record, content_hash)
+        await bumpDataVersion(username)
+    timer.report(file_name)
 
+    print("Saved on MongoDB ☑️")
+    return record
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""Reference ranges and the indicators derived from them, shared by the dashboard and suggestions.
+
+Every computation works on the whole (reports x parameters) array at once, grouped by user, so a
+single user's dashboard and a cohort report over many users go through the same code.
+
+    python -m utils.healthIndicators                  # cohort report over every user
+    python -m utils.healthIndicators --users alice bob
+"""
+from utils.database import runAsync
+from utils.metricsStore import loadCohortFrame
+from utils.labParser import LAB_FIELDS
+import pandas as pd
+import numpy as np
+import argparse
+
+# Reference normal ranges for parameters
+REFERENCE_RANGES = {
+    "blood_sugar_fasting": {"range": (70, 100), "unit": "mg/dL"},
+    "blood_sugar_pp": {"range": (100, 140), "unit": "mg/dL"},
+    "blood_pressure_systolic": {"range": (90, 120), "unit": "mmHg"},
+    "blood_pressure_diastolic": {"range": (60, 80), "unit": "mmHg"},
+    "hemoglobin": {"range": (13.5, 17.5), "unit": "g/dL"},
+    "rbc": {"range": (4.5, 5.9), "unit": "M/µL"},
+    "wbc": {"range": (4000, 11000), "unit": "cells/µL"},
+    "platelets": {"range": (150000, 450000), "unit": "cells/µL"},
+    "cholesterol_total": {"range": (125, 200), "unit": "mg/dL"},
+    "hdl": {"range": (40, 60), "unit": "mg/dL"},
+    "ldl": {"range": (0, 100), "unit": "mg/dL"},
+    "triglycerides": {"range": (0, 150), "unit": "mg/dL"},
+    "creatinine": {"range": (0.6, 1.3), "unit": "mg/dL"},
+    "sgot": {"range": (0, 40), "unit": "U/L"},
+    "sgpt": {"range": (0, 40), "unit": "U/L"},
+    "tsh": {"range": (0.4, 4.0), "unit": "mIU/L"},
+}
+
+LOW = np.array([REFERENCE_RANGES[field]["range"][0] for field in LAB_FIELDS], dtype=np.float64)
+HIGH = np.array([REFERENCE_RANGES[field]["range"][1] for field in LAB_FIELDS], dtype=np.float64)
+UNITS = [REFERENCE_RANGES[field]["unit"] for field in LAB_FIELDS]
+
+STATUS_LABELS = np.array(["Low", "Normal", "High"])
+ROLLING_WINDOW = 3
+TREND_DAYS = 30
+
+
+def classify(values):
+    """Returns an array shaped like values with "Low"/"Normal"/"High", or None where a value is missing."""
+    values = np.asarray(values, dtype=np.float64)
+    codes = (values >= LOW).astype(np.int8) + (values > HIGH)
+    return np.where(np.isnan(values), None, STATUS_LABELS[codes])
+
+
+def rangeDistance(values):
+    """Signed distance outside the normal range in range widths: 0 inside, -0.5 is half a width below."""
+    values = np.asarray(values, dtype=np.float64)
+    width = HIGH - LOW
+    return np.where(values < LOW, (values - LOW) / width, np.where(values > HIGH, (values - HIGH) / width, 0.0))
+
+
+def groupedIndicators(frame, groups, window=ROLLING_WINDOW):
+    """Computes the indicators of every parameter for every group of rows in one pass.
+
+    frame holds LAB_FIELDS columns indexed by report time (oldest first within each group) and
+    groups labels each row with its owner. Parameters missing from the frame count as never
+    measured, so a frame with only some of the columns works too. Returns one row per (group, parameter) that has at
+    least one reading, with the latest value, its status and range distance, the least-squares
+    trend per TREND_DAYS days and the mean / std of the last `window` readings.
+    """
+    values = frame.reindex(columns=LAB_FIELDS).to_numpy(dtype=np.float64)
+    codes, keys = pd.factorize(np.asarray(groups), sort=True)
+    present = ~np.isnan(values)
+
+    # Days since the earliest report, weighted by presence so missing values drop out of every sum
+    # An empty frame from loadMetricsFrame has a plain index, not a DatetimeIndex
+    times = pd.DatetimeIndex(frame.index)
+    days = ((times - times.min()) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)[:, None]
+    x = np.where(present, days, 0.0)
+    y = np.where(present, values, 0.0)
+
+    def groupSum(array):
+        return pd.DataFrame(array).groupby(codes).sum().to_numpy()
+
+    n = groupSum(present.astype(np.float64))
+    sx, sy = groupSum(x), groupSum(y)
+    sxx, sxy = groupSum(x * x), groupSum(x * y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = n * sxx - sx * sx
+        slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+
+    # Rank the readings of each parameter from the newest backwards to pick the last `window`
+    from_end = pd.DataFrame(present[::-1]).groupby(codes[::-1]).cumsum().to_numpy()[::-1]
+    recent = pd.DataFrame(np.where(present & (from_end <= window), values, np.nan)).groupby(codes)
+    rolling_mean = recent.mean().to_numpy()
+    rolling_std = recent.std(ddof=0).to_numpy()
+
+    latest = pd.DataFrame(values).groupby(codes).last().to_numpy()
+
+    result = pd.DataFrame({
+        "group": np.repeat(keys, len(LAB_FIELDS)),
+        "parameter": np.tile(LAB_FIELDS, len(keys)),
+        "readings": n.ravel().astype(int),
+        "latest": latest.ravel(),
+        "unit": np.tile(UNITS, len(keys)),
+        "low": np.tile(LOW, len(keys)),
+        "high": np.tile(HIGH, len(keys)),
+        "status": classify(latest).ravel(),
+        "distance": rangeDistance(latest).ravel(),
+        f"trend_per_{TREND_DAYS}d": (slope * TREND_DAYS).ravel(),
+        "rolling_mean": rolling_mean.ravel(),
+        "rolling_std": rolling_std.ravel(),
+    })
+    return result[result["readings"] > 0].set_index(["group", "parameter"])
+
+
+def userIndicators(frame, window=ROLLING_WINDOW):
+    """Indicators for a single user's frame (as returned by loadMetricsFrame), indexed by parameter."""
+    return groupedIndicators(frame, np.zeros(len(frame), dtype=np.int8), window).droplevel("group")
+
+
+def cohortIndicators(frame, window=ROLLING_WINDOW):
+    """Indicators for every user of a cohort frame (as returned by loadCohortFrame), indexed by (user, parameter)."""
+    return groupedIndicators(frame, frame["user"].to_numpy(), window).rename_axis(["user", "parameter"])
+
+
+def cohortReport(indicators):
+    """Per parameter: users with readings, share Low / Normal / High on their latest value and the median trend."""
+    counts = pd.crosstab(indicators.index.get_level_values("parameter"), indicators["status"])
+    counts = counts.reindex(columns=STATUS_LABELS, fill_value=0)
+    report = counts.div(counts.sum(axis=1), axis=0).add_prefix("share_").rename_axis(columns=None)
+    report.insert(0, "users", counts.sum(axis=1))
+    report[f"median_trend_per_{TREND_DAYS}d"] = indicators.groupby(level="parameter")[f"trend_per_{TREND_DAYS}d"].median()
+    return report.reindex([field for field in LAB_FIELDS if field in report.index]).rename_axis("parameter")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", nargs="+", default=None, help="limit the report to these users")
+    parser.add_argument("--window", type=int, default=ROLLING_WINDOW, help="readings in the rolling statistics")
+    parser.add_argument("--csv", default=None, help="also write the per-user indicators to this file")
+    args = parser.parse_args()
+
+    frame = runAsync(loadCohortFrame(args.users))
+    if frame.empty:
+        raise SystemExit("No metrics found for the selected users")
+
+    indicators = cohortIndicators(frame, args.window)
+    print(f"{frame['user'].nunique()} users, {len(frame)} reports")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(cohortReport(indicators).round(3))
+    if args.csv:
+        indicators.to_csv(args.csv)
+        print(f"Wrote {len(indicators)} rows to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
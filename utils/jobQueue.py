@@ -0,0 +1,267 @@
+from utils.database import runAsync
+from dotenv import load_dotenv
+from pathlib import Path
+from contextlib import closing
+import threading
+import sqlite3
+import json
+import time
+import uuid
+import os
+
+load_dotenv()
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+JOB_DB_PATH = Path(os.getenv("JOB_DB_PATH", DATA_DIR / "jobs.sqlite3"))
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", DATA_DIR / "uploads"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+POLL_SECONDS = 1.0
+
+# queued -> running -> done | failed; failed jobs go back to queued through retryJob
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_initialized = False
+_workers = []
+_wakeup = threading.Event()
+_lock = threading.Lock()
+
+
+def _connect():
+    global _initialized
+    JOB_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(JOB_DB_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    if _initialized:
+        return connection
+
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT,
+            progress REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            result TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+    _initialized = True
+    return connection
+
+
+def _toDict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def saveUpload(data, suffix):
+    """Writes uploaded bytes somewhere that survives a restart and returns the path."""
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    path = UPLOAD_DIR / f"{uuid.uuid4().hex}{suffix}"
+    path.write_bytes(data)
+    return str(path)
+
+
+def enqueueJob(username, payload):
+    """Adds an ingestion job and returns its id."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with closing(_connect()) as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, username, payload, status, stage, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, username, json.dumps(payload), QUEUED, QUEUED, now, now),
+        )
+    _wakeup.set()
+    return job_id
+
+
+def getJob(job_id):
+    with closing(_connect()) as connection:
+        return _toDict(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def listJobs(username, limit=20):
+    with closing(_connect()) as connection:
+        rows = connection.execute(
+            "SELECT * FROM jobs WHERE username = ? ORDER BY created_at DESC LIMIT ?", (username, limit)
+        ).fetchall()
+    return [_toDict(row) for row in rows]
+
+
+def updateJob(job_id, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect()) as connection:
+        connection.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def retryJob(job_id):
+    """Puts a failed job back on the queue. Returns False if the job had not failed."""
+    with closing(_connect()) as connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = ?, stage = ?, progress = 0, error = NULL, updated_at = ? WHERE id = ? AND status = ?",
+            (QUEUED, QUEUED, time.time(), job_id, FAILED),
+        )
+    if cursor.rowcount:
+        _wakeup.set()
+    return bool(cursor.rowcount)
+
+
+def _claimJob():
+    """Atomically moves the oldest queued job to running and returns it."""
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        row = connection.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+        ).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, time.time(), row["id"]),
+            )
+        connection.execute("COMMIT")
+        return _toDict(row)
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+
+def _recoverInterrupted():
+    """Requeues jobs that were running when the previous process stopped."""
+    with closing(_connect()) as connection:
+        connection.execute(
+            "UPDATE jobs SET status = ?, stage = ?, progress = 0, updated_at = ? WHERE status = ?",
+            (QUEUED, QUEUED, time.time(), RUNNING),
+        )
+
+
+def _summarize(record):
+    return {
+        "file_name": record.get("file_name"),
+        "report_id": str(record.get("_id")),
+        "duplicate": bool(record.get("duplicate")),
+        "parsed_data": record.get("parsed_data"),
+        "timings": record.get("timings"),
+    }
+
+
+class ProgressRecorder:
+    """Writes a job's progress to SQLite from its own thread.
+
+    The pipeline reports progress from the event loop every session shares, and an updateJob can
+    wait up to 30 s on the database lock, so report() only stores the latest stage and returns.
+    Stages reported while a write is in progress collapse into the newest one.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.latest = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._write, name=f"progress-{job_id[:8]}", daemon=True)
+        self.thread.start()
+
+    def report(self, stage, fraction):
+        with self.condition:
+            self.latest = (stage, fraction)
+            self.condition.notify()
+
+    def _write(self):
+        while True:
+            with self.condition:
+                while self.latest is None and not self.closed:
+                    self.condition.wait()
+                if self.latest is None:
+                    return
+                stage, fraction = self.latest
+                self.latest = None
+            try:
+                updateJob(self.job_id, stage=stage, progress=fraction)
+            except sqlite3.Error as e:
+                print(f"Could not record progress of job {self.job_id}: {e}")
+
+    def close(self):
+        """Writes the last reported stage and stops the thread, so later status updates win."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+
+def _runJob(job):
+    # Imported here because the pipeline pulls in the OCR and embedding stacks
+    from utils.extractTextFunction import extractText
+    from utils.batchIngest import extractBatch
+
+    payload = job["payload"]
+    recorder = ProgressRecorder(job["id"])
+
+    try:
+        if "files" in payload:
+            records = runAsync(extractBatch(
+                payload["files"],
+                job["username"],
+                force=payload.get("force", False),
+                progress=recorder.report,
+            ))
+            return {"reports": [_summarize(record) for record in records]}
+
+        record = runAsync(extractText(
+            payload["file_path"],
+            payload["file_extension"],
+            payload["file_name"],
+            job["username"],
+            force=payload.get("force", False),
+            progress=recorder.report,
+        ))
+        return _summarize(record)
+    finally:
+        recorder.close()
+
+
+def _uploadedPaths(payload):
+    return [file["file_path"] for file in payload.get("files", [payload])]
+
+
+def _workerLoop():
+    while True:
+        job = _claimJob()
+        if job is None:
+            _wakeup.wait(POLL_SECONDS)
+            _wakeup.clear()
+            continue
+
+        try:
+            result = _runJob(job)
+            updateJob(job["id"], status=DONE, stage=DONE, progress=1.0, result=json.dumps(result))
+            # The upload is kept until the job succeeds so that failed jobs can be retried
+            for file_path in _uploadedPaths(job["payload"]):
+                Path(file_path).unlink(missing_ok=True)
+        except Exception as e:
+            print(f"Job {job['id']} failed: {e}")
+            updateJob(job["id"], status=FAILED, error=str(e))
+
+
+def startWorkers(count=INGEST_WORKERS):
+    """Starts the ingestion worker threads, once per process."""
+    with _lock:
+        if _workers:
+            return
+        _recoverInterrupted()
+        for index in range(count):
+            worker = threading.Thread(target=_workerLoop, name=f"ingest-worker-{index}", daemon=True)
+            worker.start()
+            _workers.append(worker)
@@ -0,0 +1,226 @@
+from dotenv import load_dotenv
+import re
+import os
+
+load_dotenv()
+
+# Values read with at least this confidence are kept without asking the LLM
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.7"))
+
+# The 16 lab parameters every report is mapped onto, in a fixed order
+LAB_FIELDS = [
+    "blood_sugar_fasting",
+    "blood_sugar_pp",
+    "blood_pressure_systolic",
+    "blood_pressure_diastolic",
+    "hemoglobin",
+    "rbc",
+    "wbc",
+    "platelets",
+    "cholesterol_total",
+    "hdl",
+    "ldl",
+    "triglycerides",
+    "creatinine",
+    "sgot",
+    "sgpt",
+    "tsh",
+]
+
+# Labels used by the common lab layouts for each parameter
+FIELD_LABELS = {
+    "blood_sugar_fasting": [r"fasting\s+(?:blood\s+|plasma\s+)?(?:sugar|glucose)", r"(?:sugar|glucose)\s*\(\s*F\s*\)", r"(?:sugar|glucose)[,\s-]*\(?fasting\)?", r"\bFBS\b", r"\bFPG\b"],
+    "blood_sugar_pp": [r"post[\s-]*prandial\s+(?:blood\s+|plasma\s+)?(?:sugar|glucose)", r"(?:sugar|glucose)[,\s-]*\(?(?:pp|post[\s-]*prandial)\)?", r"\bPPBS\b", r"\bPP\s*(?:BS|sugar|glucose)\b"],
+    "blood_pressure_systolic": [r"systolic(?:\s+(?:blood\s+)?pressure)?", r"\bSBP\b"],
+    "blood_pressure_diastolic": [r"diastolic(?:\s+(?:blood\s+)?pressure)?", r"\bDBP\b"],
+    "hemoglobin": [r"ha?emoglobin", r"\bHb\b", r"\bHGB\b"],
+    "rbc": [r"\bRBC\b(?:\s+count)?", r"red\s+blood\s+cells?(?:\s+count)?", r"erythrocytes?(?:\s+count)?"],
+    "wbc": [r"\bWBC\b(?:\s+count)?", r"white\s+blood\s+cells?(?:\s+count)?", r"\bTLC\b", r"total\s+leu[ck]ocyte\s+count"],
+    "platelets": [r"platelets?(?:\s+count)?", r"\bPLT\b"],
+    "cholesterol_total": [r"total\s+cholesterol", r"cholesterol[,\s-]*total", r"serum\s+cholesterol"],
+    "hdl": [r"(?<!non-)(?<!non\s)\bHDL\b(?:[\s-]*cholesterol)?", r"high\s+density\s+lipoprotein"],
+    "ldl": [r"\bLDL\b(?:[\s-]*cholesterol)?", r"low\s+density\s+lipoprotein"],
+    "triglycerides": [r"triglycerides?", r"\bTG\b"],
+    "creatinine": [r"(?:serum\s+)?creatinine"],
+    "sgot": [r"\bSGOT\b", r"\bS\.\s?G\.\s?O\.\s?T\b\.?", r"serum\s+glutamic[\s-]+oxal(?:o)?acetic\s+transaminase", r"\bAST\b", r"aspartate\s+(?:amino)?transferase"],
+    "sgpt": [r"\bSGPT\b", r"\bS\.\s?G\.\s?P\.\s?T\b\.?", r"serum\s+glutamic[\s-]+pyruvic\s+transaminase", r"\bALT\b", r"alanine\s+(?:amino)?transferase"],
+    "tsh": [r"\bTSH\b", r"\bT\.\s?S\.\s?H\b\.?", r"thyrotropin", r"thyroid\s+stimulating\s+hormone"],
+}
+
+# Physiologically possible values after unit normalization; anything outside is a misread
+PLAUSIBLE_RANGES = {
+    "blood_sugar_fasting": (20, 1000),
+    "blood_sugar_pp": (20, 1000),
+    "blood_pressure_systolic": (60, 260),
+    "blood_pressure_diastolic": (30, 160),
+    "hemoglobin": (3, 25),
+    "rbc": (1, 9),
+    "wbc": (500, 100000),
+    "platelets": (5000, 2000000),
+    "cholesterol_total": (50, 600),
+    "hdl": (5, 200),
+    "ldl": (10, 500),
+    "triglycerides": (20, 3000),
+    "creatinine": (0.1, 20),
+    "sgot": (1, 5000),
+    "sgpt": (1, 5000),
+    "tsh": (0.001, 200),
+}
+
+# A value after a label: plain ("12.5") or with thousands separators ("1,50,000"), then an optional unit
+NUMBER_PATTERN = r"\d{1,3}(?:,\d{2,3})+(?!\d)|\d+(?:\.\d+)?"
+UNIT_PATTERN = r"(?:x\s*)?10\s*[\^*]?\s*\d+\s*/\s*\S+|10[³⁶]\s*/\s*\S+|[^\s\d(\[][^\s]*"
+MULTIPLIER_PATTERN = r"x\s*10\s*[\^*]?\s*\d+\s*/\s*\S+|10\s*[\^*]\s*\d+\s*/\s*\S+|10[³⁶]\s*/\s*\S+"
+RANGE_PATTERN = rf"(?:{NUMBER_PATTERN})\s*(?:-|–|to)\s*(?:{NUMBER_PATTERN})"
+
+# What may sit between a label and its value on the same line. Reference ranges ("40-60"),
+# bracketed text ("(Ref: 40-60)", "[13.5 - 17.5]"), ordinals ("3rd Generation") and multipliers
+# written before the value ("x10^3/uL") are stepped over instead of being read as the value.
+VALUE_WINDOW = 80
+_token = re.compile(
+    rf"(?P<bracket>\([^)\n]*\)|\[[^\]\n]*\])"
+    rf"|(?P<range>{RANGE_PATTERN})"
+    rf"|(?P<multiplier>{MULTIPLIER_PATTERN})"
+    rf"|(?P<ordinal>\d+(?:st|nd|rd|th)\b)"
+    rf"|(?P<value>{NUMBER_PATTERN})\s*(?P<unit>{UNIT_PATTERN})?",
+    re.IGNORECASE,
+)
+# Lines carrying a reference range or bracketed numbers are too easy to misread; their values
+# are kept below RULE_CONFIDENCE_THRESHOLD so the LLM confirms them
+AMBIGUOUS_PATTERN = re.compile(rf"{RANGE_PATTERN}|\([^)\n]*\d[^)\n]*\)|\[[^\]\n]*\d[^\]\n]*\]", re.IGNORECASE)
+AMBIGUOUS_CONFIDENCE = 0.5
+
+BLOOD_PRESSURE_PATTERN = re.compile(r"(?:blood\s+pressure|\bB\.?P\.?\b)[^\d\n]{0,30}?(\d{2,3})\s*/\s*(\d{2,3})", re.IGNORECASE)
+
+_patterns = {
+    field: [re.compile(label, re.IGNORECASE) for label in labels]
+    for field, labels in FIELD_LABELS.items()
+}
+LABEL_PATTERNS = {
+    field: re.compile("|".join(labels), re.IGNORECASE)
+    for field, labels in FIELD_LABELS.items()
+}
+
+GLUCOSE_MMOL_TO_MG = 18.016
+CHOLESTEROL_MMOL_TO_MG = 38.67
+TRIGLYCERIDES_MMOL_TO_MG = 88.57
+CREATININE_UMOL_TO_MG = 1 / 88.4
+
+
+def normalizeValue(field, value, unit):
+    """Converts a value to the schema's base unit. Returns (value, confidence)."""
+    unit = (unit or "").lower().replace("μ", "µ").replace(" ", "")
+    confidence = 0.9 if unit else 0.75
+
+    if field in ("blood_sugar_fasting", "blood_sugar_pp") and "mmol" in unit:
+        value *= GLUCOSE_MMOL_TO_MG
+    elif field in ("cholesterol_total", "hdl", "ldl") and "mmol" in unit:
+        value *= CHOLESTEROL_MMOL_TO_MG
+    elif field == "triglycerides" and "mmol" in unit:
+        value *= TRIGLYCERIDES_MMOL_TO_MG
+    elif field == "creatinine" and ("µmol" in unit or "umol" in unit):
+        value *= CREATININE_UMOL_TO_MG
+    elif field == "hemoglobin" and unit.startswith("g/l"):
+        value /= 10
+    elif field in ("wbc", "platelets"):
+        if "lakh" in unit or "lac" in unit:
+            value *= 100000
+        elif any(marker in unit for marker in ("10^3", "10*3", "10³", "k/", "thou")):
+            value *= 1000
+        elif field == "wbc" and value < 100:
+            # Reported in thousands without saying so
+            value *= 1000
+            confidence = 0.7
+        elif field == "platelets" and value < 5000:
+            value *= 1000
+            confidence = 0.7
+    elif field == "rbc" and value > 100000:
+        # Reported as cells/µL instead of millions/µL
+        value /= 1000000
+        confidence = 0.7
+
+    low, high = PLAUSIBLE_RANGES[field]
+    if not low <= value <= high:
+        return value, 0.2
+    return round(value, 3), confidence
+
+
+def readValue(text, label_match):
+    """Reads the value that follows a label match on its line. Returns (value, unit, ambiguous) or None."""
+    line_start = text.rfind("\n", 0, label_match.start()) + 1
+    line_end = text.find("\n", label_match.end())
+    line_end = len(text) if line_end < 0 else line_end
+    rest = text[label_match.end():min(line_end, label_match.end() + VALUE_WINDOW)]
+
+    multiplier = None
+    for token in _token.finditer(rest):
+        if token.group("multiplier"):
+            multiplier = token.group("multiplier")
+        elif token.group("value"):
+            # The label itself is left out, so a label written with brackets does not count
+            line = text[line_start:label_match.start()] + " " + text[label_match.end():line_end]
+            return (
+                float(token.group("value").replace(",", "")),
+                token.group("unit") or multiplier,
+                AMBIGUOUS_PATTERN.search(line) is not None,
+            )
+    return None
+
+
+def parseLabValues(text):
+    """Extracts the lab parameters with regular expressions and unit normalization.
+
+    Returns (values, confidence, mentioned): values and confidence are keyed by every field in
+    LAB_FIELDS (None / 0.0 when not found), and mentioned is the set of fields whose label
+    appears in the text at all, found or not.
+    """
+    values = {field: None for field in LAB_FIELDS}
+    confidence = {field: 0.0 for field in LAB_FIELDS}
+    mentioned = {field for field, pattern in LABEL_PATTERNS.items() if pattern.search(text)}
+
+    for field, patterns in _patterns.items():
+        candidates = []
+        for pattern in patterns:
+            for match in pattern.finditer(text):
+                reading = readValue(text, match)
+                if reading is None:
+                    continue
+                value, unit, ambiguous = reading
+                value, field_confidence = normalizeValue(field, value, unit)
+                if ambiguous and field_confidence > 0.2:
+                    field_confidence = min(field_confidence, AMBIGUOUS_CONFIDENCE)
+                candidates.append((value, field_confidence))
+
+        plausible = [candidate for candidate in candidates if candidate[1] > 0.2]
+        if not plausible:
+            continue
+
+        # The first plausible reading wins; disagreeing readings lower the confidence
+        value, field_confidence = plausible[0]
+        if any(abs(other - value) > 1e-6 for other, _ in plausible[1:]):
+            field_confidence = min(field_confidence, 0.5)
+        values[field] = value
+        confidence[field] = field_confidence
+
+    # "Blood Pressure: 120/80" fills both halves at once
+    match = BLOOD_PRESSURE_PATTERN.search(text)
+    if match:
+        mentioned.update({"blood_pressure_systolic", "blood_pressure_diastolic"})
+        for field, raw in (("blood_pressure_systolic", match.group(1)), ("blood_pressure_diastolic", match.group(2))):
+            value, field_confidence = normalizeValue(field, float(raw), "mmHg")
+            if field_confidence > confidence[field]:
+                values[field] = value
+                confidence[field] = field_confidence
+
+    return values, confidence, mentioned
+
+
+def unresolvedFields(text, confidence):
+    """Returns the fields the LLM has to fill: every one not read with RULE_CONFIDENCE_THRESHOLD.
+
+    Labels the patterns do not know are common, so a field is asked for whether or not its label
+    was recognised. Nothing is asked for an empty text.
+    """
+    if not text.strip():
+        return []
+    return [field for field in LAB_FIELDS if confidence[field] < RULE_CONFIDENCE_THRESHOLD]
@@ -0,0 +1,117 @@
+from contextlib import closing
+from dotenv import load_dotenv
+from pathlib import Path
+import hashlib
+import threading
+import sqlite3
+import json
+import time
+import re
+import os
+
+load_dotenv()
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", DATA_DIR / "llm_cache.sqlite3"))
+# Newest extractions kept in the cache; 0 keeps every entry of the current model and prompt
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+_initialized = False
+# Approximate row count kept by putCached so the bound is checked without a COUNT(*) per write
+_entries = None
+_lock = threading.Lock()
+
+
+def _connect():
+    global _initialized
+    LLM_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(LLM_CACHE_PATH, timeout=30, isolation_level=None)
+    if _initialized:
+        return connection
+
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS extractions (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS extractions_created_at ON extractions (created_at)")
+    _initialized = True
+    return connection
+
+
+def promptVersion(prompt):
+    """Derives a version from the prompt text itself, so any edit to the prompt changes it."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def normalizeText(text):
+    """Collapses whitespace so OCR or PDF layout noise does not defeat the cache."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def extractionKey(text, model, prompt_version, fields):
+    parts = [model, prompt_version, ",".join(sorted(fields)), normalizeText(text)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def getCached(key):
+    """Returns the cached parsed JSON for the key, or None."""
+    with closing(_connect()) as connection:
+        row = connection.execute("SELECT result FROM extractions WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _evictOldest(connection, keep):
+    return connection.execute(
+        "DELETE FROM extractions WHERE key IN "
+        "(SELECT key FROM extractions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+        (keep,),
+    ).rowcount
+
+
+def putCached(key, model, prompt_version, result, max_entries=LLM_CACHE_MAX_ENTRIES):
+    """Stores the result; past max_entries the oldest entries are evicted down to 90% of it."""
+    global _entries
+    with closing(_connect()) as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO extractions (key, model, prompt_version, result, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, model, prompt_version, json.dumps(result), time.time()),
+        )
+        if max_entries <= 0:
+            return
+
+        with _lock:
+            if _entries is None:
+                _entries = connection.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            else:
+                _entries += 1
+            if _entries <= max_entries:
+                return
+            # Replaced keys and other processes make the counter approximate, so recount first
+            _entries = connection.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            if _entries > max_entries:
+                keep = int(max_entries * 0.9)
+                _evictOldest(connection, keep)
+                _entries = keep
+
+
+def pruneStale(model, prompt_version, max_entries=LLM_CACHE_MAX_ENTRIES):
+    """Deletes entries written by any other model or prompt version, then the oldest beyond max_entries.
+
+    Returns how many were removed.
+    """
+    global _entries
+    with closing(_connect()) as connection:
+        removed = connection.execute(
+            "DELETE FROM extractions WHERE model != ? OR prompt_version != ?", (model, prompt_version)
+        ).rowcount
+        if max_entries > 0:
+            removed += _evictOldest(connection, max_entries)
+        with _lock:
+            _entries = None
+    return removed
@@ -0,0 +1,125 @@
+from utils.database import getReports, getMetrics
+from utils.labParser import LAB_FIELDS
+import pandas as pd
+import numpy as np
+
+# One compact row per report: the 16 lab parameters as a little-endian float32 array in
+# LAB_FIELDS order (64 bytes) plus a bitmask with bit i set when LAB_FIELDS[i] has a value.
+VALUE_DTYPE = np.dtype("<f4")
+FIELD_BITS = np.uint32(1) << np.arange(len(LAB_FIELDS), dtype=np.uint32)
+
+
+def encodeMetrics(parsed_data):
+    """Returns (values_bytes, mask) for a parsed_data dict."""
+    values = np.zeros(len(LAB_FIELDS), dtype=VALUE_DTYPE)
+    mask = 0
+    for index, field in enumerate(LAB_FIELDS):
+        value = (parsed_data or {}).get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value):
+            values[index] = value
+            mask |= 1 << index
+    return values.tobytes(), mask
+
+
+def metricsDocument(record):
+    """Builds the Metrics row for a saved Sources record."""
+    values, mask = encodeMetrics(record.get("parsed_data"))
+    return {
+        "user": record["user"],
+        "report_id": record["_id"],
+        "created_at": record["created_at"],
+        "values": values,
+        "mask": mask,
+    }
+
+
+def decodeMetrics(values, masks):
+    """Turns concatenated value bytes and per-row masks into an (n, 16) array with NaN for missing values."""
+    array = np.frombuffer(values, dtype=VALUE_DTYPE).reshape(-1, len(LAB_FIELDS)).astype(np.float64)
+    present = (np.asarray(masks, dtype=np.uint32)[:, None] & FIELD_BITS) != 0
+    array[~present] = np.nan
+    return array
+
+
+async def saveMetrics(records):
+    """Writes the Metrics rows for newly inserted Sources records."""
+    if records:
+        await getMetrics().insert_many([metricsDocument(record) for record in records])
+
+
+async def loadMetricsFrame(username):
+    """Returns the user's lab values as a DataFrame indexed by report time, oldest first."""
+    cursor = getMetrics().find(
+        {"user": username},
+        projection={"_id": 0, "created_at": 1, "values": 1, "mask": 1},
+    ).sort("created_at", 1)
+
+    times, values, masks = [], [], []
+    async for row in cursor:
+        times.append(row["created_at"])
+        values.append(row["values"])
+        masks.append(row["mask"])
+
+    if not times:
+        return pd.DataFrame(columns=LAB_FIELDS, dtype=np.float64)
+
+    return pd.DataFrame(
+        decodeMetrics(b"".join(values), masks),
+        columns=LAB_FIELDS,
+        index=pd.DatetimeIndex(times, name="created_at"),
+    )
+
+
+async def loadCohortFrame(usernames=None):
+    """Returns the lab values of many users (all when usernames is None) with a "user" column, oldest first."""
+    query = {} if usernames is None else {"user": {"$in": list(usernames)}}
+    cursor = getMetrics().find(
+        query,
+        projection={"_id": 0, "user": 1, "created_at": 1, "values": 1, "mask": 1},
+    ).sort([("user", 1), ("created_at", 1)])
+
+    users, times, values, masks = [], [], [], []
+    async for row in cursor:
+        users.append(row["user"])
+        times.append(row["created_at"])
+        values.append(row["values"])
+        masks.append(row["mask"])
+
+    frame = pd.DataFrame(
+        decodeMetrics(b"".join(values), masks) if times else np.empty((0, len(LAB_FIELDS))),
+        columns=LAB_FIELDS,
+        index=pd.DatetimeIndex(times, name="created_at"),
+    )
+    frame.insert(0, "user", users)
+    return frame
+
+
+async def backfillMetrics():
+    """Writes Metrics rows for reports saved before the compact store existed."""
+    written = 0
+    batch = []
+    cursor = getReports().find(
+        {"metrics_written": {"$ne": True}},
+        projection={"user": 1, "created_at": 1, "parsed_data": 1},
+    )
+    async for record in cursor:
+        batch.append(record)
+        if len(batch) >= 500:
+            written += await _backfillBatch(batch)
+            batch = []
+    if batch:
+        written += await _backfillBatch(batch)
+    return written
+
+
+async def _backfillBatch(records):
+    # Upsert by report_id so a backfill that was interrupted half way can simply run again
+    metrics = getMetrics()
+    for record in records:
+        document = metricsDocument(record)
+        await metrics.update_one({"report_id": record["_id"]}, {"$set": document}, upsert=True)
+    await getReports().update_many(
+        {"_id": {"$in": [record["_id"] for record in records]}},
+        {"$set": {"metrics_written": True}},
+    )
+    return len(records)
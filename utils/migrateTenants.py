@@ -0,0 +1,210 @@
+"""Moves the points of ai_health_analysis into a multitenant collection.
+
+The target collection gets per-user HNSW graphs and a tenant index on "user". Older points that only
+carry the user under metadata.user (written through langchain_qdrant) get it copied to the top
+level on the way. With --switch, ai_health_analysis becomes an alias of the new collection, so the
+application keeps using the same name; set QDRANT_MULTITENANCY=1 before restarting it.
+
+The copy can run while the application is up. Switching a plain collection (not yet an alias) has
+to delete it before the alias can take its name, so stop the application first and pass
+--app-stopped: points written after the last catch-up pass would be lost, and searches would find
+no collection in between. Re-running with --switch after an interrupted switch only creates the alias.
+
+    python -m utils.migrateTenants                          # copy into ai_health_analysis_tenants and verify
+    python -m utils.migrateTenants --switch --app-stopped   # ...then point ai_health_analysis at it
+"""
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, PointIdsList, CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+from dotenv import load_dotenv
+from utils.database import COLLECTION_NAME
+from utils.vectorStore import collectionConfig, userIndexSchema, QUANTIZATION, METADATA_KEY, EMBEDDING_METADATA_KEY
+import argparse
+import time
+import os
+
+load_dotenv()
+
+BATCH_SIZE = 512
+
+
+def resolveCollection(client, name):
+    """Returns (collection, is_alias) for a name that may be an alias."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == name:
+            return alias.collection_name, True
+    return name, False
+
+
+def copyPoints(client, points, target):
+    """Upserts points into target with "user" at the top level. Returns (copied, skipped)."""
+    batch = []
+    skipped = 0
+    for point in points:
+        payload = dict(point.payload or {})
+        user = payload.get("user") or (payload.get(METADATA_KEY) or {}).get("user")
+        if not user:
+            # Unowned points could never match a per-user search
+            skipped += 1
+            continue
+        payload["user"] = user
+        batch.append(PointStruct(id=point.id, vector=point.vector, payload=payload))
+    if batch:
+        client.upsert(target, points=batch, wait=True)
+    return len(batch), skipped
+
+
+def migrate(client, source, target):
+    """Copies every point of source into target. Returns (copied, skipped)."""
+    config = client.get_collection(source).config
+    dimension = config.params.vectors.size
+    # The copied vectors come from the same embedding model, so the target records it too
+    embedding = (config.metadata or {}).get(EMBEDDING_METADATA_KEY)
+
+    if not client.collection_exists(target):
+        client.create_collection(
+            collection_name=target, **collectionConfig(dimension, QUANTIZATION, multitenancy=True, embedding=embedding)
+        )
+        client.create_payload_index(target, field_name="user", field_schema=userIndexSchema(multitenancy=True), wait=True)
+
+    copied = skipped = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(source, limit=BATCH_SIZE, offset=offset, with_vectors=True, with_payload=True)
+        batch_copied, batch_skipped = copyPoints(client, points, target)
+        copied += batch_copied
+        skipped += batch_skipped
+        if batch_copied:
+            print(f"Copied {copied} points")
+        if offset is None:
+            return copied, skipped
+
+
+def pointIds(client, collection):
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(collection, limit=BATCH_SIZE * 8, offset=offset, with_vectors=False, with_payload=False)
+        ids.update(point.id for point in points)
+        if offset is None:
+            return ids
+
+
+def catchUp(client, source, target):
+    """Brings target up to date with the writes source received since the first pass.
+
+    Points added to source are copied, points deleted from source (replaced or removed reports)
+    are deleted from target. Returns (copied, skipped, deleted, expected), where expected is the
+    number of source points target has to hold.
+    """
+    source_ids = pointIds(client, source)
+    target_ids = pointIds(client, target)
+
+    # Unowned points are never copied, so they show up as missing on every pass
+    missing = list(source_ids - target_ids)
+    copied = skipped = 0
+    for start in range(0, len(missing), BATCH_SIZE):
+        points = client.retrieve(source, ids=missing[start:start + BATCH_SIZE], with_vectors=True, with_payload=True)
+        batch_copied, batch_skipped = copyPoints(client, points, target)
+        copied += batch_copied
+        skipped += batch_skipped
+
+    removed = list(target_ids - source_ids)
+    if removed:
+        client.delete(target, points_selector=PointIdsList(points=removed), wait=True)
+    return copied, skipped, len(removed), len(source_ids) - skipped
+
+
+def createAlias(client, target, attempts=3):
+    """Points COLLECTION_NAME at target, retrying briefly. Returns the last error, or None on success."""
+    error = None
+    for attempt in range(attempts):
+        try:
+            client.update_collection_aliases(change_aliases_operations=[
+                CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=COLLECTION_NAME)),
+            ])
+            return None
+        except Exception as e:
+            error = e
+            print(f"Creating the alias failed (attempt {attempt + 1}/{attempts}): {e}")
+            time.sleep(2 ** attempt)
+    return error
+
+
+def switchAlias(client, source, target, source_is_alias):
+    if source_is_alias:
+        # Re-point the alias atomically; the old collection stays until dropped by hand
+        client.update_collection_aliases(change_aliases_operations=[
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=COLLECTION_NAME)),
+            CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=COLLECTION_NAME)),
+        ])
+        print(f"{COLLECTION_NAME} now points at {target}; {source} can be deleted once verified")
+        return
+
+    # An alias cannot share its name with a collection, so the original has to go first. Copy
+    # whatever was written since the first pass, and check the counts once more, before deleting it.
+    copied, _, deleted, expected = catchUp(client, source, target)
+    print(f"Catch-up pass copied {copied} new points and deleted {deleted} removed ones")
+    actual = client.count(target, exact=True).count
+    if actual < expected:
+        raise SystemExit(f"Target holds {actual} points but {expected} were expected; not switching")
+
+    client.delete_collection(source)
+    error = createAlias(client, target)
+    if error is not None:
+        # Every point is in target, but the application has no collection under its name now
+        raise SystemExit(
+            f"Deleted {source} but could not create the alias {COLLECTION_NAME} -> {target}: {error}. "
+            f"All points are in {target}; re-run with --switch to create the alias before starting the application."
+        )
+    print(f"Deleted {source}; {COLLECTION_NAME} is now an alias of {target}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default=f"{COLLECTION_NAME}_tenants")
+    parser.add_argument("--switch", action="store_true", help=f"make {COLLECTION_NAME} an alias of the target afterwards")
+    parser.add_argument(
+        "--app-stopped", action="store_true",
+        help=f"confirm the application is stopped; required to --switch while {COLLECTION_NAME} is a plain collection",
+    )
+    args = parser.parse_args()
+
+    client = QdrantClient(
+        url=os.getenv("VECTORDB_URL", "http://localhost:6333"),
+        api_key=os.getenv("QDRANT_API_KEY") or None,
+        timeout=60,
+    )
+
+    source, source_is_alias = resolveCollection(client, COLLECTION_NAME)
+    if source == args.target:
+        raise SystemExit(f"{COLLECTION_NAME} already points at {args.target}")
+
+    if not source_is_alias and not client.collection_exists(source):
+        # A previous --switch deleted the original but did not get to create the alias
+        if args.switch and client.collection_exists(args.target):
+            error = createAlias(client, args.target)
+            if error is not None:
+                raise SystemExit(f"Could not create the alias {COLLECTION_NAME} -> {args.target}: {error}")
+            print(f"{COLLECTION_NAME} is now an alias of {args.target}")
+            return
+        raise SystemExit(f"{COLLECTION_NAME} does not exist")
+
+    if args.switch and not source_is_alias and not args.app_stopped:
+        raise SystemExit(
+            f"{COLLECTION_NAME} is a plain collection and has to be deleted for the alias; "
+            f"stop the application and re-run with --app-stopped"
+        )
+
+    copied, skipped = migrate(client, source, args.target)
+    expected = client.count(source, exact=True).count - skipped
+    actual = client.count(args.target, exact=True).count
+    print(f"Copied {copied} points, skipped {skipped} without a user; target holds {actual}")
+    if actual < expected:
+        raise SystemExit(f"Target holds {actual} points but {expected} were expected; not switching")
+
+    if args.switch:
+        switchAlias(client, source, args.target, source_is_alias)
+
+
+if __name__ == "__main__":
+    main()
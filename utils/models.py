@@ -0,0 +1,148 @@
+from langchain_huggingface import HuggingFaceEmbeddings
+from utils.embeddingCache import CachedEmbeddings
+from dotenv import load_dotenv
+import threading
+import time
+import os
+
+try:
+    import resource
+except ImportError:  # resource is Unix only
+    resource = None
+
+load_dotenv()
+
+# Embedding backend: "torch" runs the model in full precision with PyTorch, "onnx" runs the same
+# weights through ONNX Runtime and "onnx-int8" runs a dynamically quantized int8 export
+# (EMBEDDING_ONNX_FILE). The ONNX backends need sentence-transformers[onnx] installed.
+# The sentence-transformers model repos publish model_quint8_avx2.onnx, which runs on any x86-64
+# CPU with AVX2, next to model_qint8_avx512.onnx, model_qint8_avx512_vnni.onnx and model_qint8_arm64.onnx.
+# Switching to a model with another vector size fails at startup (see ensureCollection).
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 keeps the library default
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+OCR_LANGUAGES = ["en"]
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1").lower() in ("1", "true", "yes")
+
+# One instance of every model per process, shared across all Streamlit sessions
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+_warm_thread = None
+
+
+def _currentMemoryMB():
+    """Returns the peak resident memory of the process in MB (None if unavailable)."""
+    if resource is None:
+        return None
+    # ru_maxrss is reported in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _getOrLoad(name, loader):
+    """Returns the cached model called `name`, loading it with `loader` the first time."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another session may have finished loading while we waited on the lock
+        if name in _models:
+            return _models[name]
+
+        memory_before = _currentMemoryMB()
+        start = time.perf_counter()
+        model = loader()
+        load_seconds = time.perf_counter() - start
+        memory_after = _currentMemoryMB()
+
+        _models[name] = model
+        _stats[name] = {
+            "load_seconds": round(load_seconds, 3),
+            "memory_mb": round(memory_after - memory_before, 1) if memory_before is not None else None,
+        }
+        print(f"Loaded {name} in {load_seconds:.2f}s")
+        return model
+
+
+def embeddingName(model=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    """Identifies the vectors a model/backend pair produces; int8 vectors differ slightly from full precision."""
+    return model if backend == "torch" else f"{model}@{backend}"
+
+
+def buildEmbedding(model=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, batch_size=EMBED_BATCH_SIZE, threads=EMBEDDING_THREADS):
+    """Creates an uncached embedding model for the given backend."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+    model_kwargs = {"device": "cpu"}
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+    else:
+        model_kwargs["backend"] = "onnx"
+        onnx_kwargs = {"provider": "CPUExecutionProvider"}
+        if backend == "onnx-int8":
+            onnx_kwargs["file_name"] = EMBEDDING_ONNX_FILE
+        if threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = threads
+            onnx_kwargs["session_options"] = session_options
+        model_kwargs["model_kwargs"] = onnx_kwargs
+
+    return HuggingFaceEmbeddings(
+        model_name=model,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+def getEmbedding():
+    """Returns the shared embedding model, behind the on-disk embedding cache unless EMBEDDING_CACHE=0."""
+    def load():
+        embedding = buildEmbedding()
+        return CachedEmbeddings(embedding, embeddingName()) if EMBEDDING_CACHE else embedding
+
+    return _getOrLoad("embedding", load)
+
+
+def getReader():
+    """Returns the shared easyocr Reader."""
+    def load():
+        # easyocr pulls in torch, so only import it when OCR is actually needed
+        import easyocr
+        return easyocr.Reader(OCR_LANGUAGES)
+
+    return _getOrLoad("ocr", load)
+
+
+def warmUp(names=("embedding", "ocr")):
+    """Loads the given models ahead of the first request."""
+    loaders = {"embedding": getEmbedding, "ocr": getReader}
+    for name in names:
+        loaders[name]()
+    return modelStats()
+
+
+def warmUpInBackground(names=("embedding", "ocr")):
+    """Starts warmUp on a daemon thread, once per process."""
+    global _warm_thread
+    with _lock:
+        if _warm_thread is not None:
+            return
+        _warm_thread = threading.Thread(target=warmUp, args=(names,), daemon=True)
+        _warm_thread.start()
+
+
+def modelStats():
+    """Returns the load time and memory growth recorded for every loaded model, plus embedding cache hit rates."""
+    stats = {name: dict(model_stats) for name, model_stats in _stats.items()}
+    embedding = _models.get("embedding")
+    if isinstance(embedding, CachedEmbeddings):
+        stats["embedding"]["cache"] = embedding.stats()
+    return stats
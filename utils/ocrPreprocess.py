@@ -0,0 +1,92 @@
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+import numpy as np
+import os
+
+load_dotenv()
+
+# Longest side an image is scaled down to before OCR; phone photos are often 4000+ pixels wide
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))
+OCR_DESKEW = os.getenv("OCR_DESKEW", "1").lower() in ("1", "true", "yes")
+OCR_CROP = os.getenv("OCR_CROP", "0").lower() in ("1", "true", "yes")
+
+# Skew is searched on a small copy, coarse steps first and then around the best coarse angle
+DESKEW_SIDE = 800
+DESKEW_MAX_ANGLE = 10.0
+DESKEW_MIN_ANGLE = 0.3
+CROP_MARGIN = 0.02
+
+
+def otsuThreshold(pixels):
+    """Returns the gray level that best separates ink from paper."""
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight = np.cumsum(histogram)
+    mean = np.cumsum(histogram * levels)
+    total_weight, total_mean = weight[-1], mean[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (total_mean * weight - mean * total_weight) ** 2 / (weight * (total_weight - weight))
+    return int(np.nanargmax(between))
+
+
+def _inkMask(image):
+    pixels = np.asarray(image, dtype=np.uint8)
+    return pixels < otsuThreshold(pixels)
+
+
+def skewAngle(image):
+    """Estimates the text skew in degrees by maximizing the variance of the row ink profile."""
+    small = image.copy()
+    small.thumbnail((DESKEW_SIDE, DESKEW_SIDE))
+    ink = Image.fromarray((_inkMask(small) * 255).astype(np.uint8))
+
+    def score(angle):
+        rows = np.asarray(ink.rotate(angle, resample=Image.NEAREST, expand=True), dtype=np.float64).sum(axis=1)
+        return rows.var()
+
+    coarse = max(np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 0.1, 1.0), key=score)
+    return float(max(np.arange(coarse - 1.0, coarse + 1.01, 0.1), key=score))
+
+
+def cropToText(image):
+    """Crops to the bounding box of the rows and columns that carry ink, plus a small margin."""
+    ink = _inkMask(image)
+    rows = np.flatnonzero(ink.mean(axis=1) > 0.002)
+    columns = np.flatnonzero(ink.mean(axis=0) > 0.002)
+    if not len(rows) or not len(columns):
+        return image
+    margin = int(max(image.size) * CROP_MARGIN)
+    return image.crop((
+        max(columns[0] - margin, 0),
+        max(rows[0] - margin, 0),
+        min(columns[-1] + margin + 1, image.width),
+        min(rows[-1] + margin + 1, image.height),
+    ))
+
+
+def preprocessImage(image, max_side=OCR_MAX_SIDE, deskew=OCR_DESKEW, crop=OCR_CROP):
+    """Prepares a PIL image for easyocr: upright, grayscale, at most max_side pixels, straightened and cropped.
+
+    Returns a uint8 array, which readtext accepts directly.
+    """
+    image = ImageOps.exif_transpose(image).convert("L")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    if deskew:
+        angle = skewAngle(image)
+        if abs(angle) >= DESKEW_MIN_ANGLE:
+            image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    if crop:
+        image = cropToText(image)
+    return np.asarray(image)
+
+
+def preprocessFile(file_path, max_side=OCR_MAX_SIDE, deskew=OCR_DESKEW, crop=OCR_CROP):
+    """Loads and preprocesses an image file; JPEGs are decoded straight at a reduced scale when possible."""
+    with Image.open(file_path) as image:
+        # draft() lets the JPEG decoder skip detail beyond what the size cap keeps
+        scale = min(max_side / max(image.size), 1.0)
+        image.draft("L", (int(image.width * scale), int(image.height * scale)))
+        return preprocessImage(image, max_side, deskew, crop)
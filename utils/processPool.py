@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+import multiprocessing
+import threading
+import sys
+import os
+
+load_dotenv()
+
+# Every worker loads its own easyocr Reader and torch, about 1 GB resident per process, so the
+# default stays small; raise it on machines with the memory to spare.
+BATCH_PROCESSES = int(os.getenv("BATCH_PROCESSES", "2"))
+# torch defaults to one intra-op thread per core in every process, so BATCH_PROCESSES workers
+# would run about cores² threads; each worker gets its share of the cores instead
+BATCH_WORKER_THREADS = int(os.getenv("BATCH_WORKER_THREADS", str(max(1, (os.cpu_count() or 1) // BATCH_PROCESSES))))
+
+# OCR and PDF parsing are CPU bound, so they run in worker processes. Each process keeps
+# its own warm easyocr Reader through utils.models for as long as the pool lives.
+_pool = None
+_lock = threading.Lock()
+
+
+def _initWorker(threads):
+    # Read by torch (and the BLAS it uses) when it is first imported in this process
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def getProcessPool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn avoids forking a process that already runs Streamlit and event loop threads
+            _pool = ProcessPoolExecutor(
+                max_workers=BATCH_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initWorker,
+                initargs=(BATCH_WORKER_THREADS,),
+            )
+        return _pool
@@ -0,0 +1,77 @@
+from dotenv import load_dotenv
+import pypdfium2
+import asyncio
+import time
+import os
+from utils.models import getReader
+from utils.processPool import getProcessPool
+from utils.ocrPreprocess import preprocessImage
+
+load_dotenv()
+
+# A page with less extractable text than this is treated as a scanned image
+SCANNED_PAGE_MIN_CHARS = int(os.getenv("SCANNED_PAGE_MIN_CHARS", "20"))
+# Resolution scanned pages are rendered at before OCR
+OCR_RENDER_DPI = int(os.getenv("OCR_RENDER_DPI", "200"))
+
+
+def isScanned(page_text):
+    return len(page_text.strip()) < SCANNED_PAGE_MIN_CHARS
+
+
+def rasterizePage(file_path, page_number):
+    """Renders the page to one RGB image.
+
+    Rendering rather than pulling out the embedded images applies /Rotate and puts tiled or
+    striped scans back together the way a viewer shows them.
+    """
+    pdf = pypdfium2.PdfDocument(file_path)
+    try:
+        bitmap = pdf[page_number].render(scale=OCR_RENDER_DPI / 72)
+        return bitmap.to_pil().convert("RGB")
+    finally:
+        pdf.close()
+
+
+def ocrPage(file_path, page_number):
+    """OCRs a single page and returns (page_number, text, seconds). Runs in the process pool."""
+    start = time.perf_counter()
+    try:
+        image = rasterizePage(file_path, page_number)
+    except Exception as e:
+        # An image the renderer cannot decode (e.g. a broken JBIG2 stream) only loses this page
+        print(f"Warning: skipping OCR of page {page_number + 1}, it could not be rendered: {e}")
+        return page_number, "", time.perf_counter() - start
+    lines = getReader().readtext(preprocessImage(image), detail=0)
+    return page_number, "\n".join(lines), time.perf_counter() - start
+
+
+async def ocrPages(file_path, page_numbers):
+    """OCRs the pages in parallel and returns ({page_number: text}, [(page_number, seconds)])."""
+    if not page_numbers:
+        return {}, []
+
+    loop = asyncio.get_running_loop()
+    pool = getProcessPool()
+    results = await asyncio.gather(*[
+        loop.run_in_executor(pool, ocrPage, file_path, page_number)
+        for page_number in page_numbers
+    ])
+
+    texts = {}
+    timings = []
+    for page_number, text, seconds in results:
+        print(f"OCR page {page_number + 1}: {seconds:.2f}s, {len(text)} chars")
+        texts[page_number] = text
+        timings.append((page_number, seconds))
+    return texts, timings
+
+
+def reportTimings(timings):
+    if not timings:
+        return
+    seconds = [s for _, s in timings]
+    print(
+        f"OCR'd {len(seconds)} scanned pages: total {sum(seconds):.2f}s, "
+        f"mean {sum(seconds) / len(seconds):.2f}s, slowest {max(seconds):.2f}s"
+    )
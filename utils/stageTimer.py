@@ -0,0 +1,57 @@
+from contextlib import contextmanager, nullcontext
+import asyncio
+import time
+
+
+class StageTimer:
+    """Records how long each stage of one pipeline run was busy and when it started and ended.
+
+    A stage may run several times (one embedding batch after another); its busy time is the sum,
+    while its span runs from its first start to its last end. Comparing the sum of busy times
+    with the wall-clock total shows how much of the work overlapped.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            busy, first, _ = self.stages.get(name, (0.0, start, end))
+            self.stages[name] = (busy + end - start, min(first, start), end)
+
+    def summary(self):
+        """Returns {stage: busy seconds} plus "total" for the wall-clock time so far."""
+        timings = {name: round(busy, 3) for name, (busy, _, _) in self.stages.items()}
+        timings["total"] = round(time.perf_counter() - self.started, 3)
+        return timings
+
+    def report(self, label):
+        timings = self.summary()
+        total = timings.pop("total")
+        stages = ", ".join(
+            f"{name} {busy:.2f}s (at {first - self.started:.2f}-{end - self.started:.2f}s)"
+            for name, (busy, first, end) in self.stages.items()
+        )
+        print(f"{label} stage timings: {stages}; total {total:.2f}s vs {sum(timings.values()):.2f}s run back to back")
+
+
+def stageOf(timer, name):
+    """timer.stage(name), or a no-op when no timer is given."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+async def runConcurrently(*coroutines):
+    """Runs independent stages at once and returns their results; if one fails the others are cancelled."""
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(coroutine) for coroutine in coroutines]
+    except ExceptionGroup as errors:
+        # Surface the first failure itself so callers see the same errors as before
+        raise errors.exceptions[0]
+    return [task.result() for task in tasks]
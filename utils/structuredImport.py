@@ -0,0 +1,257 @@
+"""Bulk import of delimited exports (glucose meters, BP cuffs, lab CSVs) into the Metrics collection.
+
+Files are read row by row and written in batches of IMPORT_BATCH_SIZE, so memory stays flat for
+exports of any length. Every row with at least one value becomes one Metrics row tied to the
+file's Sources record through source_id; no text is embedded and no LLM is called.
+"""
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from bson import ObjectId
+import pandas as pd
+import numpy as np
+import itertools
+import asyncio
+import csv
+import os
+import re
+from utils.database import getMetrics
+from utils.labParser import LAB_FIELDS, LABEL_PATTERNS, normalizeValue
+from utils.metricsStore import encodeMetrics
+
+load_dotenv()
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+STRUCTURED_EXTENSIONS = ["csv", "txt"]
+SNIFF_BYTES = 64 * 1024
+
+# Column names used by device exports that the report labels in labParser do not cover
+EXPORT_ALIASES = {
+    "blood_pressure_systolic": re.compile(r"^sys\b", re.IGNORECASE),
+    "blood_pressure_diastolic": re.compile(r"^dia\b", re.IGNORECASE),
+}
+GLUCOSE_COLUMN = re.compile(r"\b(?:blood\s+|plasma\s+)?(?:glucose|sugar)\b|\bBG\b", re.IGNORECASE)
+BLOOD_PRESSURE_COLUMN = re.compile(r"^(?:blood\s+pressure|B\.?P\.?)$", re.IGNORECASE)
+TIME_COLUMN = re.compile(r"date|time|recorded|measured", re.IGNORECASE)
+# Meters tag readings with the meal they relate to; untagged readings count as fasting
+MEAL_COLUMN = re.compile(r"meal|tag|context|marker|period", re.IGNORECASE)
+AFTER_MEAL = re.compile(r"after|post|\bpp\b", re.IGNORECASE)
+UNIT_IN_HEADER = re.compile(r"\s*[(\[]\s*([^)\]]+?)\s*[)\]]\s*")
+# A unit written after the name without brackets, e.g. "glucose mmol/L" or "Platelets 10^3/uL"
+BARE_UNIT_IN_HEADER = re.compile(
+    r"\s+((?:[µμunp]|m)?(?:mol|g|IU|U)(?:/\S+)?|mmHg|%|(?:x\s?)?10\^?\d+(?:/\S+)?|(?:k|cells|lakhs?)/\S+)\s*$",
+    re.IGNORECASE,
+)
+
+
+def mapColumns(header):
+    """Maps header names onto lab fields. Returns None when no column holds a lab parameter."""
+    columns = {"fields": {}, "glucose": None, "blood_pressure": None, "time": [], "meal": None}
+    for index, name in enumerate(header):
+        unit_match = UNIT_IN_HEADER.search(name) or BARE_UNIT_IN_HEADER.search(name)
+        unit = unit_match.group(1) if unit_match else ""
+        label = BARE_UNIT_IN_HEADER.sub("", UNIT_IN_HEADER.sub(" ", name)).strip()
+        if not label:
+            continue
+
+        field = next((field for field, pattern in EXPORT_ALIASES.items() if pattern.search(label)), None)
+        field = field or next((field for field in LAB_FIELDS if LABEL_PATTERNS[field].search(label)), None)
+        if field is not None and field not in {mapped for mapped, _ in columns["fields"].values()}:
+            columns["fields"][index] = (field, unit)
+        elif BLOOD_PRESSURE_COLUMN.search(label):
+            columns["blood_pressure"] = index
+        elif GLUCOSE_COLUMN.search(label) and columns["glucose"] is None:
+            columns["glucose"] = (index, unit)
+        elif MEAL_COLUMN.search(label):
+            columns["meal"] = index
+        elif TIME_COLUMN.search(label):
+            columns["time"].append(index)
+
+    if not columns["fields"] and columns["glucose"] is None and columns["blood_pressure"] is None:
+        return None
+    return columns
+
+
+def sniffTable(file_path):
+    """Returns (dialect, header, columns) when the file is a delimited table of lab values, else None."""
+    with open(file_path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        sample = f.read(SNIFF_BYTES)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        return None
+
+    rows = csv.reader(sample.splitlines(), dialect)
+    header = next(rows, None)
+    first_row = next(rows, None)
+    if not header or len(header) < 2 or first_row is None:
+        return None
+
+    columns = mapColumns(header)
+    if columns is None:
+        return None
+    # Prose that happens to split on a delimiter maps a header but yields no numbers below it;
+    # the first data row counts too, a single-reading export has no other
+    decimal_comma = dialect.delimiter == ";"
+    if not any(parseRow(row, columns, decimal_comma) for row in itertools.chain([first_row], rows)):
+        return None
+    return dialect, header, columns
+
+
+def _number(cell, decimal_comma):
+    cell = cell.strip()
+    if decimal_comma and "," in cell:
+        cell = cell.replace(".", "").replace(",", ".")
+    else:
+        cell = cell.replace(",", "")
+    try:
+        value = float(cell)
+    except ValueError:
+        return None
+    return value if np.isfinite(value) else None
+
+
+def parseRow(row, columns, decimal_comma):
+    """Returns {field: value} for the normalized, plausible values of one row."""
+    values = {}
+
+    def put(field, raw, unit):
+        value = _number(raw, decimal_comma)
+        if value is None:
+            return
+        value, confidence = normalizeValue(field, value, unit)
+        if confidence > 0.2:
+            values[field] = value
+
+    for index, (field, unit) in columns["fields"].items():
+        if index < len(row):
+            put(field, row[index], unit)
+
+    if columns["glucose"] is not None and columns["glucose"][0] < len(row):
+        index, unit = columns["glucose"]
+        meal = row[columns["meal"]] if columns["meal"] is not None and columns["meal"] < len(row) else ""
+        put("blood_sugar_pp" if AFTER_MEAL.search(meal) else "blood_sugar_fasting", row[index], unit)
+
+    if columns["blood_pressure"] is not None and columns["blood_pressure"] < len(row):
+        systolic, _, diastolic = row[columns["blood_pressure"]].partition("/")
+        put("blood_pressure_systolic", systolic, "mmHg")
+        put("blood_pressure_diastolic", diastolic, "mmHg")
+
+    return values
+
+
+def _rowTimes(batch, started_at):
+    """Returns the created_at of every row in the batch.
+
+    Rows without a readable timestamp keep file order, one microsecond apart after the import time.
+    """
+    times = pd.to_datetime([stamp for _, stamp, _ in batch], errors="coerce", utc=True, format="mixed")
+    return [
+        started_at + timedelta(microseconds=row_number) if pd.isna(stamp) else stamp.to_pydatetime()
+        for (row_number, _, _), stamp in zip(batch, times)
+    ]
+
+
+async def _writeBatch(batch, times, username, source_id):
+    documents = []
+    for (_, _, values), created_at in zip(batch, times):
+        encoded, mask = encodeMetrics(values)
+        documents.append({
+            "user": username,
+            "report_id": ObjectId(),
+            "source_id": source_id,
+            "created_at": created_at,
+            "values": encoded,
+            "mask": mask,
+        })
+    await getMetrics().insert_many(documents, ordered=False)
+
+
+def _readBatches(file_path, dialect, columns):
+    """Yields (batch, rows_skipped, bytes_read) for every IMPORT_BATCH_SIZE rows with values.
+
+    Runs on a worker thread: reading and parsing the rows is synchronous, CPU-bound work.
+    """
+    decimal_comma = dialect.delimiter == ";"
+    read_bytes = skipped = 0
+    batch = []
+    with open(file_path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        def lines():
+            nonlocal read_bytes
+            for line in f:
+                read_bytes += len(line)
+                yield line
+
+        rows = csv.reader(lines(), dialect)
+        next(rows, None)  # header
+        for row_number, row in enumerate(rows):
+            values = parseRow(row, columns, decimal_comma)
+            if not values:
+                skipped += 1
+                continue
+            stamp = " ".join(row[index] for index in columns["time"] if index < len(row)) or None
+            batch.append((row_number, stamp, values))
+
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                yield batch, skipped, read_bytes
+                batch = []
+    yield batch, skipped, read_bytes
+
+
+async def importTable(file_path, table, username, source_id, progress=None):
+    """Streams a sniffed table into Metrics rows owned by the Sources record `source_id`.
+
+    Returns (parsed_result, extraction, summary): parsed_result holds the latest value of every
+    field, extraction describes the column mapping and row counts, and summary is a short text
+    stored as the record's raw_text.
+    """
+    progress = progress or (lambda stage, fraction: None)
+    dialect, header, columns = table
+    total_bytes = max(os.path.getsize(file_path), 1)
+    started_at = datetime.now(timezone.utc)
+
+    latest = {field: None for field in LAB_FIELDS}
+    # When each field's latest value was measured; many exports list the newest reading first
+    latest_at = {}
+    imported = skipped = 0
+    batches = None
+
+    try:
+        batches = _readBatches(file_path, dialect, columns)
+        while True:
+            # The next batch is read and parsed off the event loop
+            step = await asyncio.to_thread(next, batches, None)
+            if step is None:
+                break
+            batch, skipped, read_bytes = step
+            if not batch:
+                continue
+            times = _rowTimes(batch, started_at)
+            for (_, _, values), created_at in zip(batch, times):
+                for field, value in values.items():
+                    if field not in latest_at or created_at >= latest_at[field]:
+                        latest[field] = value
+                        latest_at[field] = created_at
+            await _writeBatch(batch, times, username, source_id)
+            imported += len(batch)
+            progress(f"imported {imported} rows", 0.1 + 0.8 * min(read_bytes / total_bytes, 1))
+    except Exception:
+        # Leave nothing half imported behind; the upload can be retried as a whole
+        if batches is not None:
+            batches.close()
+        await getMetrics().delete_many({"source_id": source_id})
+        raise
+
+    if not imported:
+        raise Exception("No lab values found in the table")
+
+    mapping = {header[index]: field for index, (field, _) in columns["fields"].items()}
+    if columns["glucose"] is not None:
+        mapping[header[columns["glucose"][0]]] = "blood_sugar_fasting / blood_sugar_pp"
+    if columns["blood_pressure"] is not None:
+        mapping[header[columns["blood_pressure"]]] = "blood_pressure_systolic / blood_pressure_diastolic"
+
+    parsed_result = dict(latest, additional_notes=f"Imported {imported} readings from a table")
+    extraction = {"source": "table", "columns": mapping, "rows": imported, "skipped_rows": skipped}
+    summary = f"Imported {imported} rows ({skipped} without values). Columns: {', '.join(header)}"
+    print(f"Imported {imported} table rows, skipped {skipped}")
+    return parsed_result, extraction, summary
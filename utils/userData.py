@@ -0,0 +1,75 @@
+from pymongo import ReturnDocument
+from datetime import datetime, timezone
+from collections import OrderedDict
+from dotenv import load_dotenv
+from utils.database import getUsers, getSuggestions
+import threading
+import time
+import os
+
+load_dotenv()
+
+# How long a data_version read from MongoDB is trusted before asking again. Bumps made by this
+# process update the local copy immediately; the TTL only covers bumps made by other processes.
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "30"))
+MAX_REMEMBERED_USERS = 10000
+
+_versions = OrderedDict()
+_lock = threading.Lock()
+
+
+# Every change to a user's reports or symptoms bumps their data_version. Anything derived from
+# that data (suggestions, dashboard frames) is stored against the version it was built from and
+# is reused until the version moves on.
+
+def _remember(username, data_version):
+    with _lock:
+        _versions[username] = (data_version, time.monotonic())
+        _versions.move_to_end(username)
+        while len(_versions) > MAX_REMEMBERED_USERS:
+            _versions.popitem(last=False)
+
+
+async def getDataVersion(username, max_age=0):
+    """Returns the user's data version, trusting a local copy younger than max_age seconds."""
+    if max_age:
+        with _lock:
+            remembered = _versions.get(username)
+        if remembered and time.monotonic() - remembered[1] < max_age:
+            return remembered[0]
+
+    user = await getUsers().find_one({"user": username}, projection={"data_version": 1})
+    data_version = user.get("data_version", 0) if user else 0
+    _remember(username, data_version)
+    return data_version
+
+
+async def bumpDataVersion(username):
+    """Marks the user's data as changed and returns the new version."""
+    user = await getUsers().find_one_and_update(
+        {"user": username},
+        {"$inc": {"data_version": 1}},
+        projection={"data_version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _remember(username, user["data_version"])
+    return user["data_version"]
+
+
+async def getStoredSuggestions(username, data_version):
+    """Returns the suggestions generated for this exact data version, or None."""
+    stored = await getSuggestions().find_one({"user": username, "data_version": data_version})
+    return stored["text"] if stored else None
+
+
+async def storeSuggestions(username, data_version, text):
+    await getSuggestions().update_one(
+        {"user": username},
+        {"$set": {
+            "data_version": data_version,
+            "text": text,
+            "created_at": datetime.now(timezone.utc),
+        }},
+        upsert=True,
+    )
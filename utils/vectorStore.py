@@ -0,0 +1,291 @@
+from langchain_core.documents import Document
+from qdrant_client.models import (
+    Filter, FieldCondition, MatchValue, PointStruct, PointIdsList, VectorParams, VectorParamsDiff, Distance,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig,
+    QuantizationSearchParams, SearchParams, HnswConfigDiff, Disabled, KeywordIndexParams, KeywordIndexType,
+)
+from utils.database import getQdrant, COLLECTION_NAME
+from utils.models import getEmbedding, embeddingName, EMBED_BATCH_SIZE
+from utils.stageTimer import stageOf
+import asyncio
+import uuid
+import os
+
+# Payload layout matches langchain_qdrant's QdrantVectorStore so existing points stay readable.
+# "user" is also copied to the top level, where the keyword index and search filter expect it.
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
+DISTANCE = Distance.COSINE
+
+# Vector storage mode: "none" keeps float32 vectors in RAM, "scalar" keeps int8 copies in RAM and
+# "binary" keeps 1-bit copies in RAM. Quantized modes move the originals to disk and use them
+# only to rescore the oversampled candidates.
+QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+SEARCH_HNSW_EF = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "128"))
+RESCORE = os.getenv("QDRANT_RESCORE", "1").lower() in ("1", "true", "yes")
+OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+
+# Multitenancy mode: "user" becomes a tenant index (points stored grouped by user) and the global
+# HNSW graph is replaced by one graph per user, so a search only walks the user's own points.
+# Existing points are moved over with `python -m utils.migrateTenants`.
+MULTITENANCY = os.getenv("QDRANT_MULTITENANCY", "0").lower() in ("1", "true", "yes")
+
+# Collection metadata entry naming the model and backend whose vectors the collection holds
+EMBEDDING_METADATA_KEY = "embedding"
+
+_collection_ready = False
+
+
+def quantizationConfig(mode=QUANTIZATION):
+    if mode == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if mode == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    if mode == "none":
+        return None
+    raise ValueError(f"Unknown QDRANT_QUANTIZATION mode: {mode}")
+
+
+def hnswConfig(multitenancy=MULTITENANCY):
+    if multitenancy:
+        return HnswConfigDiff(m=0, payload_m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT)
+    return HnswConfigDiff(m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT)
+
+
+def userIndexSchema(multitenancy=MULTITENANCY):
+    return KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=multitenancy)
+
+
+def searchParams(mode=QUANTIZATION):
+    """Search parameters matching the storage mode (rescoring only applies to quantized vectors)."""
+    if mode == "none":
+        return SearchParams(hnsw_ef=SEARCH_HNSW_EF)
+    return SearchParams(
+        hnsw_ef=SEARCH_HNSW_EF,
+        quantization=QuantizationSearchParams(rescore=RESCORE, oversampling=OVERSAMPLING),
+    )
+
+
+def collectionConfig(dimension, mode=QUANTIZATION, multitenancy=MULTITENANCY, embedding=None):
+    """Keyword arguments for create_collection in the given storage and tenancy mode.
+
+    `embedding` (an embeddingName) is recorded in the collection metadata, so a later start with
+    another model or backend is caught instead of mixing embedding spaces.
+    """
+    config = {
+        "vectors_config": VectorParams(size=dimension, distance=DISTANCE, on_disk=mode != "none"),
+        "hnsw_config": hnswConfig(multitenancy),
+        "quantization_config": quantizationConfig(mode),
+        "on_disk_payload": True,
+    }
+    if embedding is not None:
+        config["metadata"] = {EMBEDDING_METADATA_KEY: embedding}
+    return config
+
+
+def _quantizationMode(config):
+    if config is None:
+        return "none"
+    if getattr(config, "scalar", None) is not None:
+        return "scalar"
+    if getattr(config, "binary", None) is not None:
+        return "binary"
+    return "other"
+
+
+def embeddingDimension():
+    """Returns the size of the vectors the configured embedding model produces."""
+    return len(getEmbedding().embed_query("dimension probe"))
+
+
+async def ensureCollection():
+    """Creates or validates the collection and its 'user' keyword index, once per process.
+
+    Raises ValueError when an existing collection was built for a different vector size, since
+    every upsert and search against it would fail, or holds vectors of another embedding model or
+    backend, since searches would silently compare vectors from different embedding spaces.
+    """
+    global _collection_ready
+    if _collection_ready:
+        return
+
+    client = getQdrant()
+    # Loading the model and the probe embedding take seconds; the shared loop keeps serving meanwhile
+    dimension = await asyncio.to_thread(embeddingDimension)
+
+    if not await client.collection_exists(COLLECTION_NAME):
+        await client.create_collection(collection_name=COLLECTION_NAME, **collectionConfig(dimension, embedding=embeddingName()))
+        print(f"Created collection {COLLECTION_NAME} ({dimension} dimensions, quantization: {QUANTIZATION})")
+    print(f"Embedding with {embeddingName()} ({dimension} dimensions)")
+
+    info = await client.get_collection(COLLECTION_NAME)
+    vectors = info.config.params.vectors
+    if vectors.size != dimension:
+        raise ValueError(
+            f"Collection {COLLECTION_NAME} stores {vectors.size}-dimensional vectors "
+            f"but the embedding model {embeddingName()} produces {dimension}; "
+            f"use a model of the same size or migrate the collection"
+        )
+    if vectors.distance != DISTANCE:
+        print(f"Collection {COLLECTION_NAME} uses {vectors.distance} distance instead of {DISTANCE}")
+
+    stored = (info.config.metadata or {}).get(EMBEDDING_METADATA_KEY)
+    if stored != embeddingName():
+        if stored is not None and info.points_count:
+            raise ValueError(
+                f"Collection {COLLECTION_NAME} holds vectors from {stored} but the application now embeds with "
+                f"{embeddingName()}; switch EMBEDDING_MODEL / EMBEDDING_BACKEND back or re-index the reports "
+                f"into a new collection"
+            )
+        # A new or empty collection, or one created before the model was recorded
+        await client.update_collection(
+            collection_name=COLLECTION_NAME,
+            metadata={EMBEDDING_METADATA_KEY: embeddingName()},
+        )
+        if stored is None and info.points_count:
+            print(f"Collection {COLLECTION_NAME} did not record its embedding model; assuming {embeddingName()}")
+
+    # Switch an existing collection to the configured storage mode; Qdrant rebuilds in the background
+    current_mode = _quantizationMode(info.config.quantization_config)
+    if current_mode != QUANTIZATION:
+        await client.update_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config={"": VectorParamsDiff(on_disk=QUANTIZATION != "none")},
+            hnsw_config=hnswConfig(),
+            quantization_config=quantizationConfig(QUANTIZATION) or Disabled.DISABLED,
+        )
+        print(f"Collection {COLLECTION_NAME} quantization changed from {current_mode} to {QUANTIZATION}")
+
+    # Apply changed QDRANT_HNSW_* settings and tenancy mode; Qdrant rebuilds the graphs in the background
+    current, wanted = info.config.hnsw_config, hnswConfig()
+    if (current.m, current.ef_construct, current.payload_m if MULTITENANCY else None) != (wanted.m, wanted.ef_construct, wanted.payload_m):
+        await client.update_collection(collection_name=COLLECTION_NAME, hnsw_config=wanted)
+        print(
+            f"Collection {COLLECTION_NAME} HNSW changed to {'per-user' if MULTITENANCY else 'global'} graphs "
+            f"(m={wanted.m}, payload_m={wanted.payload_m}, ef_construct={wanted.ef_construct})"
+        )
+
+    user_index = (info.payload_schema or {}).get("user")
+    is_tenant = bool(getattr(getattr(user_index, "params", None), "is_tenant", False))
+    if user_index is None or is_tenant != MULTITENANCY:
+        if user_index is not None:
+            await client.delete_payload_index(collection_name=COLLECTION_NAME, field_name="user", wait=True)
+        await client.create_payload_index(
+            collection_name=COLLECTION_NAME,
+            field_name="user",
+            field_schema=userIndexSchema(),
+            wait=True,
+        )
+        print("'user' keyword index created successfully.")
+
+    _collection_ready = True
+
+
+def userFilter(username):
+    return Filter(
+        must=[
+            FieldCondition(
+                key="user",
+                match=MatchValue(value=username)
+            )
+        ]
+    )
+
+
+async def addDocuments(documents, timer=None, indexed=None):
+    """Embeds the documents and upserts them into the shared collection, returning the point ids.
+
+    Embedding runs in batches of EMBED_BATCH_SIZE on a worker thread, so the event loop stays free,
+    and each batch is upserted UPSERT_BATCH_SIZE points at a time while the next one is embedded.
+    Busy time is recorded under "embed" and "upsert" when a StageTimer is given. When `indexed` is
+    a list, every point id is appended to it before its upsert starts, so a caller whose run fails
+    or is cancelled part way still knows which points to delete.
+    """
+    if not documents:
+        return []
+
+    embedding = await asyncio.to_thread(getEmbedding)
+
+    async def upsert(points):
+        with stageOf(timer, "upsert"):
+            for start in range(0, len(points), UPSERT_BATCH_SIZE):
+                await getQdrant().upsert(
+                    collection_name=COLLECTION_NAME,
+                    points=points[start:start + UPSERT_BATCH_SIZE],
+                    wait=True,
+                )
+
+    ids = []
+    pending = None
+    try:
+        for start in range(0, len(documents), EMBED_BATCH_SIZE):
+            batch = documents[start:start + EMBED_BATCH_SIZE]
+            with stageOf(timer, "embed"):
+                vectors = await asyncio.to_thread(embedding.embed_documents, [doc.page_content for doc in batch])
+
+            points = [
+                PointStruct(
+                    id=str(uuid.uuid4()),
+                    vector=vector,
+                    payload={
+                        CONTENT_KEY: doc.page_content,
+                        METADATA_KEY: doc.metadata,
+                        "user": doc.metadata.get("user"),
+                    },
+                )
+                for doc, vector in zip(batch, vectors)
+            ]
+            ids.extend(point.id for point in points)
+            if indexed is not None:
+                indexed.extend(point.id for point in points)
+
+            # At most one upsert in flight, so memory stays at two batches of vectors
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(upsert(points))
+
+        if pending is not None:
+            await pending
+    except BaseException:
+        if pending is not None:
+            pending.cancel()
+        raise
+    return ids
+
+
+async def similaritySearch(query, username, k=5):
+    """Returns the k chunks of the user's reports closest to the query."""
+    embedding = await asyncio.to_thread(getEmbedding)
+    vector = await asyncio.to_thread(embedding.embed_query, query)
+
+    response = await getQdrant().query_points(
+        collection_name=COLLECTION_NAME,
+        query=vector,
+        query_filter=userFilter(username),
+        search_params=searchParams(),
+        limit=k,
+        with_payload=True,
+    )
+
+    return [
+        Document(
+            page_content=point.payload.get(CONTENT_KEY, ""),
+            metadata=point.payload.get(METADATA_KEY) or {},
+        )
+        for point in response.points
+    ]
+
+
+async def deletePoints(point_ids):
+    """Removes previously indexed chunks by id."""
+    if not point_ids:
+        return
+    await getQdrant().delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=PointIdsList(points=list(point_ids)),
+        wait=True,
+    )